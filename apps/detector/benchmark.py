@@ -0,0 +1,925 @@
+#!/usr/bin/env python3
+"""Microbenchmarks for the snare drum detector hot paths.
+
+Run on the target board (e.g. the Orange Pi) to see the per-block cost of
+the detector:
+
+    python benchmark.py              # run every benchmark
+    python benchmark.py filter       # run a single benchmark
+
+Benchmarks that also verify behaviour (e.g. that decimation finds the same
+hits) list what failed at the end and exit with status 1.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+from scipy.signal import butter, lfilter
+
+import main
+
+BLOCKSIZE = int(main.RATE * main.BLOCK_DURATION)
+
+BENCHMARKS = {}
+FAILURES = []  # Checks that failed, reported (with a non-zero exit) once the benchmarks have run
+
+def benchmark(name):
+    """Register a benchmark function under ``name``."""
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+def check(ok, what):
+    """Record ``what`` as a failure unless ``ok``; returns ``ok``."""
+    if not ok:
+        FAILURES.append(what)
+    return ok
+
+def per_call_us(func, *args, repeat=200):
+    """Return the best-of-5 average time of ``func(*args)`` in microseconds."""
+    best = float('inf')
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func(*args)
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best * 1e6
+
+def make_blocks(count, blocksize=BLOCKSIZE, channels=1, seed=0):
+    """Generate noise blocks shaped like the ones ``audio_callback`` receives."""
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, 0.05, (count, blocksize, channels)).astype(np.float32)
+
+def synth_hits(hit_rate, duration=4.0, amplitude=0.8, decay=0.03, noise=0.01, fs=main.RATE, seed=0):
+    """Synthesize a snare roll: decaying body tone plus a short noise burst per hit.
+
+    Returns the float32 signal and the sample index of each hit.
+    """
+    rng = np.random.default_rng(seed)
+    signal = rng.normal(0, noise, int(duration * fs))
+    t = np.arange(int(0.3 * fs)) / fs
+    hit = amplitude * (np.sin(2 * np.pi * 180 * t) * np.exp(-t / decay)
+                       + 0.5 * rng.normal(size=t.size) * np.exp(-t / 0.01))
+    onsets = (np.arange(0.1, duration - 0.3, 1 / hit_rate) * fs).astype(int)
+    for start in onsets:
+        signal[start:start + hit.size] += hit[:signal.size - start]
+    return signal.astype(np.float32), onsets
+
+def count_hits(detector, signal, blocksize=BLOCKSIZE):
+    """Stream ``signal`` through ``detector`` block by block and count hits."""
+    return sum(len(detector.process(signal[i:i + blocksize]))
+               for i in range(0, len(signal), blocksize))
+
+def report(label, us, blocksize=BLOCKSIZE):
+    budget_us = blocksize / main.RATE * 1e6
+    print(f"  {label:<40} {us:9.1f} µs/block  ({us / budget_us * 100:5.2f}% of real time)")
+
+# =========================
+# Benchmarks
+# =========================
+@benchmark("filter")
+def bench_filter():
+    """Per-block bandpass cost: redesign + cold lfilter vs cached stateful SOS."""
+    block = make_blocks(1)[0, :, 0]
+
+    def legacy(data, lowcut=120, highcut=250, fs=main.RATE, order=4):
+        nyquist = 0.5 * fs
+        b, a = butter(order, [lowcut / nyquist, highcut / nyquist], btype='band')
+        return lfilter(b, a, data)
+
+    stateful = main.FilterBank()
+    print(f"Bandpass filter, {BLOCKSIZE} samples @ {main.RATE} Hz")
+    report("before: butter + lfilter per block", per_call_us(legacy, block))
+    report("after: cached SOS with carried zi", per_call_us(stateful, block[:, None]))
+
+@benchmark("onset")
+def bench_onset():
+    """Per-block cost of the sample-level onset detector and fast-roll counting."""
+    block = make_blocks(1)[0, :, 0]
+    detector = main.OnsetDetector()
+    print(f"Onset detector, {BLOCKSIZE} samples @ {main.RATE} Hz")
+    report("OnsetDetector.process", per_call_us(detector.process, block))
+
+    print("  hits/s   decay   played   counted")
+    for hit_rate in (5, 10, 20, 25):
+        for decay in (0.03, 0.1):
+            signal, onsets = synth_hits(hit_rate, decay=decay)
+            counted = count_hits(main.OnsetDetector(), signal)
+            print(f"  {hit_rate:6d}   {decay:5.2f}   {len(onsets):6d}   {counted:7d}")
+
+async def measure_fanout(clients, events=50, interval=0.01):
+    """Publish hits to ``clients`` real WebSocket connections; return latencies in ms."""
+    import websockets
+
+    latencies = []
+
+    async def client(uri, ready):
+        async with websockets.connect(uri) as websocket:
+            await websocket.recv()  # "connected"
+            ready.release()
+            for _ in range(events):
+                event = json.loads(await websocket.recv())
+                latencies.append((time.perf_counter() - event["sent"]) * 1000)
+
+    # handle_client prints a line per connection; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        async with websockets.serve(main.handle_client, "localhost", 0) as server:
+            uri = f"ws://localhost:{server.sockets[0].getsockname()[1]}"
+            ready = asyncio.Semaphore(0)
+            tasks = [asyncio.create_task(client(uri, ready)) for _ in range(clients)]
+            for _ in range(clients):
+                await ready.acquire()
+            while len(main.broadcaster.subscribers) < clients:
+                await asyncio.sleep(0.001)
+            for number in range(events):
+                main.broadcaster.publish({"type": "hit", "hit_number": number, "sent": time.perf_counter()})
+                await asyncio.sleep(interval)
+            await asyncio.gather(*tasks)
+    return np.array(latencies)
+
+@benchmark("fanout")
+def bench_fanout():
+    """Per-client delivery latency of broadcast hits over localhost WebSockets."""
+    print("WebSocket fan-out, 50 hits per client")
+    print("  clients   delivered   mean ms    p99 ms    max ms")
+    for clients in (1, 10, 100):
+        latencies = asyncio.run(measure_fanout(clients))
+        print(f"  {clients:7d}   {len(latencies):9d}   {latencies.mean():7.2f}   "
+              f"{np.percentile(latencies, 99):7.2f}   {latencies.max():7.2f}")
+
+def sample_hit():
+    """A hit event as ``AudioInput.detect`` publishes it."""
+    detector = main.OnsetDetector(use_numba=False)
+    signal, _ = synth_hits(4, duration=0.5)
+    hit, = main.detect_hits_detailed(signal[:, None], adc_time=time.monotonic(), detector=detector)
+    hit.update(device=2, station=hit["channel"])
+    return hit
+
+@benchmark("protocol")
+def bench_protocol():
+    """Encode cost and wire size of a hit: JSON vs binary records (vs msgpack, if installed)."""
+    try:
+        import msgpack
+    except ImportError:
+        msgpack = None
+    hit = sample_hit()
+    encoders = {"json": lambda event: main.encode_event(event),
+                f"binary ({main.BINARY_SUBPROTOCOL})": lambda event: main.encode_event(event, binary=True)}
+    if msgpack is not None:
+        encoders["msgpack (comparison)"] = msgpack.packb
+    print("Hit encoding per event, and publishing one hit to 100 subscribers")
+    print("  encoding                      µs/event   bytes   publish µs")
+    for label, encode in encoders.items():
+        us = per_call_us(encode, hit, repeat=20000)
+        if label.startswith("msgpack"):
+            publish = ""
+        else:
+            broadcaster = main.HitBroadcaster(capacity=10000)
+            for _ in range(100):
+                broadcaster.subscribe(binary=label != "json")
+            publish = f"{per_call_us(broadcaster.publish, hit, repeat=100):10.1f}"
+            for queue in broadcaster.subscribers:
+                queue.items.clear()
+        print(f"  {label:<28} {us:9.2f}   {len(encode(hit)):5d}   {publish}")
+
+class FakeTimeInfo:
+    """Stand-in for PortAudio's time_info (zero stamps use the monotonic fallback)."""
+    currentTime = 0.0
+    inputBufferAdcTime = 0.0
+
+def feed_blocks(callback, count, interval=main.BLOCK_DURATION, sent=None):
+    """Call ``callback`` like PortAudio would, once per ``interval`` on a thread."""
+    block = np.zeros((BLOCKSIZE, 1), dtype=np.float32)
+
+    def run():
+        for _ in range(count):
+            time.sleep(interval)
+            if sent is not None:
+                sent.append(time.perf_counter())
+            callback(block, BLOCKSIZE, FakeTimeInfo, None)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+async def measure_bridge(polling, count):
+    """Run one consumer flavour for ``count`` blocks; return (CPU %, latencies in ms)."""
+    sent, latencies = [], []
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    if polling:
+        # The pre-bridge consumer: thread-safe queue polled every millisecond
+        blocks = queue.Queue()
+        feed_blocks(lambda indata, *_: blocks.put(indata.copy()), count, sent=sent)
+        while len(latencies) < count:
+            try:
+                blocks.get_nowait()
+                latencies.append((time.perf_counter() - sent[len(latencies)]) * 1000)
+            except queue.Empty:
+                pass
+            await asyncio.sleep(0.001)
+    else:
+        ring = main.BlockRing()
+        ring.attach_loop(asyncio.get_running_loop())
+        out = np.empty_like(ring.blocks[0])
+        feed_blocks(lambda indata, frames, time_info, status: ring.push(indata, 0.0), count, sent=sent)
+        while len(latencies) < count:
+            await ring.get_async(out)
+            latencies.append((time.perf_counter() - sent[len(latencies)]) * 1000)
+    cpu = (time.process_time() - cpu_start) / (time.perf_counter() - wall_start) * 100
+    return cpu, np.array(latencies)
+
+async def measure_slow_client(policy, events=3000, interval=0.0005, capacity=64, max_lag=0.1):
+    """Publish to a fast client and a frozen one; return the fast client's latencies (ms) and both outboxes' stats."""
+    import socket
+    import websockets
+
+    main.broadcaster = main.HitBroadcaster(capacity, policy, max_lag)
+    latencies = []
+
+    async def fast(uri, ready):
+        async with websockets.connect(uri) as websocket:
+            await websocket.recv()  # "connected"
+            ready.release()
+            with contextlib.suppress(asyncio.TimeoutError, websockets.exceptions.ConnectionClosed):
+                while True:
+                    message = json.loads(await asyncio.wait_for(websocket.recv(), 1.0))
+                    for event in message.get("events", [message]):
+                        latencies.append((time.perf_counter() - event["sent"]) * 1000)
+
+    async def frozen(uri, ready):
+        # Completes the handshake and never reads again, like a hung browser tab
+        host, port = uri[len("ws://"):].split(":")
+        reader, writer = await asyncio.open_connection(host, int(port))
+        writer.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        writer.write(f"GET / HTTP/1.1\r\nHost: {host}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\nSec-WebSocket-Version: 13\r\n\r\n".encode())
+        await reader.readuntil(b"\r\n\r\n")
+        writer.transport.pause_reading()
+        ready.release()
+        await asyncio.sleep(events * interval * 1.5)
+        writer.close()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        async with websockets.serve(main.handle_client, "localhost", 0) as server:
+            uri = f"ws://localhost:{server.sockets[0].getsockname()[1]}"
+            ready = asyncio.Semaphore(0)
+            tasks = [asyncio.create_task(fast(uri, ready))]
+            await ready.acquire()
+            fast_outbox, = main.broadcaster.subscribers
+            tasks.append(asyncio.create_task(frozen(uri, ready)))
+            await ready.acquire()
+            frozen_outbox, = main.broadcaster.subscribers - {fast_outbox}
+            padding = "x" * 4000  # Fill the frozen client's socket buffers quickly
+            for number in range(events):
+                main.broadcaster.publish({"type": "hit", "hit_number": number, "sent": time.perf_counter(),
+                                          "padding": padding})
+                if number % 10 == 9:
+                    await asyncio.sleep(interval * 10)
+            stats = fast_outbox.stats(), frozen_outbox.stats()
+            await asyncio.gather(*tasks)
+    main.broadcaster = main.HitBroadcaster()
+    return np.array(latencies), stats
+
+@benchmark("slowclient")
+def bench_slow_client():
+    """A frozen client next to a fast one under each slow-client policy (64-message outboxes)."""
+    events = 3000
+    print(f"Slow-client policies, {events} hits of 4 KB at 2000/s, one fast and one frozen client")
+    print("  policy         fast got   p99 ms    max ms   frozen: sent  dropped  in batches  lag ms  closed")
+    for policy in main.SLOW_CLIENT_POLICIES:
+        latencies, (fast, frozen) = asyncio.run(measure_slow_client(policy, events))
+        print(f"  {policy:<12}   {len(latencies):8d}   {np.percentile(latencies, 99):6.2f}   {latencies.max():7.2f}"
+              f"   {frozen['sent']:12d}  {frozen['dropped']:7d}  {frozen['coalesced']:10d}  "
+              f"{frozen['max_lag_ms']:6.0f}  {'yes' if frozen['closed'] else 'no'}")
+
+@benchmark("bridge")
+def bench_bridge():
+    """Idle CPU and callback-to-consumer latency of the audio thread hand-off."""
+    count = 60
+    print(f"Audio thread -> asyncio hand-off, {count} blocks of {main.BLOCK_DURATION * 1000:.0f} ms")
+    print("  consumer                          CPU %   mean ms    p99 ms")
+    for label, polling in (("before: poll + sleep(1 ms)", True), ("after: ring + loop wakeup", False)):
+        cpu, latencies = asyncio.run(measure_bridge(polling, count))
+        print(f"  {label:<32} {cpu:6.2f}   {latencies.mean():7.3f}   {np.percentile(latencies, 99):7.3f}")
+
+@benchmark("ring")
+def bench_ring():
+    """Cost and allocations of the callback -> detection ring buffer."""
+    block = make_blocks(1)[0]
+    ring = main.BlockRing()
+    out = np.empty_like(ring.blocks[0])
+
+    def push_pop():
+        ring.push(block, 0.0)
+        ring.pop(out)
+
+    def legacy():
+        blocks = queue.Queue()
+        blocks.put((block.copy(), 0.0))
+        blocks.get()
+
+    print(f"Callback -> consumer hand-off, {BLOCKSIZE} frames")
+    report("before: queue.Queue + indata.copy()", per_call_us(legacy))
+    report("after: BlockRing push + pop", per_call_us(push_pop))
+
+    for _ in range(ring.capacity):
+        push_pop()  # warm up every slot
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(1000):
+        ring.push(block, 0.0)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    grown = sum(stat.size_diff for stat in after.compare_to(before, 'lineno') if stat.size_diff > 0)
+    print(f"  1000 pushes without a consumer: {grown} bytes retained, "
+          f"fill level {ring.fill_level}/{ring.capacity}")
+    ring.pop(out)
+    print(f"  overruns counted on the next pop: {ring.overruns}")
+
+@benchmark("batch")
+def bench_batch():
+    """Batch re-scoring throughput as worker processes are added."""
+    import soundfile as sf
+
+    cores = os.cpu_count()
+    files = 2 * cores
+    print(f"Batch analysis of {files} x 30 s recordings")
+    print("  workers   wall s   x real time   speed-up")
+    with tempfile.TemporaryDirectory() as folder:
+        signal, _ = synth_hits(8, duration=30.0)
+        for number in range(files):
+            sf.write(os.path.join(folder, f"session{number}.wav"), signal, main.RATE)
+        baseline = None
+        jobs = 1
+        while True:
+            output = os.path.join(folder, f"results{jobs}.jsonl")
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                main.run_batch(folder, output, jobs=jobs)
+                elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"  {jobs:7d}   {elapsed:6.2f}   {files * 30 / elapsed:11.1f}   {baseline / elapsed:8.2f}")
+            if jobs >= cores:
+                break
+            jobs = min(jobs * 2, cores)
+
+@benchmark("shards")
+def bench_shards():
+    """Sharded analysis of one long recording vs a single pass (must match exactly)."""
+    import soundfile as sf
+
+    duration = 60.0
+    # Decimation by 7 and the flux detector's 256-sample hop do not divide a 48 kHz block of 2400
+    # frames, and nothing divides a 44.1 kHz one of 2205: shards must still land on the same grids
+    configurations = [(main.RATE, "rms", {}), (main.RATE, "flux", {"method": "flux"}),
+                      (main.RATE, "rms, decimation 7", {"decimation": 7}), (44100, "rms", {}),
+                      (44100, "flux", {"method": "flux"}),
+                      (44100, "rms, decimation 4, bleed", {"decimation": 4, "reject_bleed": True})]
+    print(f"Sharded analysis of a {duration:.0f} s recording")
+    print("  rate    detector                    shards   wall s   hits   identical")
+    with tempfile.TemporaryDirectory() as folder:
+        for fs, label, options in configurations:
+            signal = sum(synth_hits(rate, duration=duration, amplitude=amplitude, fs=fs, seed=seed)[0]
+                         for rate, amplitude, seed in ((3.1, 0.8, 1), (7.3, 0.5, 2), (1.7, 1.2, 3)))
+            path = os.path.join(folder, f"venue-{fs}.wav")
+            sf.write(path, signal, fs, subtype='FLOAT')
+            with contextlib.redirect_stdout(io.StringIO()):
+                single = main.analyze_file(path, quiet=True, detector_options=options)
+            print(f"  {fs:5d}   {label:<26} single   {single['processing_time']:6.2f}   {single['hit_count']:4d}")
+            for shards in (2, 3, 7, 16):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    sharded = main.analyze_file_sharded(path, shards, detector_options=options)
+                identical = ([h["sample"] for h in sharded["hits"]] == [h["sample"] for h in single["hits"]]
+                             and np.allclose([h["rms_value"] for h in sharded["hits"]],
+                                             [h["rms_value"] for h in single["hits"]]))
+                check(identical, f"{shards} shards, {label} at {fs} Hz: {sharded['hit_count']} hits differ "
+                                 f"from the single pass's {single['hit_count']}")
+                print(f"  {fs:5d}   {label:<26} {shards:6d}   {sharded['processing_time']:6.2f}   "
+                      f"{sharded['hit_count']:4d}   {'yes' if identical else 'NO'}")
+
+def hit_samples(detector, signal, blocksize=BLOCKSIZE):
+    """Stream ``signal`` through ``detector`` and return the hits' sample indices."""
+    return np.array([start + offset
+                     for start in range(0, len(signal), blocksize)
+                     for _, offset, _ in detector.process(signal[start:start + blocksize])])
+
+@benchmark("decimate")
+def bench_decimate():
+    """Per-block cost and hit agreement with the polyphase decimation front-end."""
+    block = make_blocks(1)[0, :, 0]
+    rolls = [(10, 0.03), (20, 0.05), (25, 0.03)]  # (hits/s, decay): steady playing and fast rolls
+    max_shift = 0.003  # Onsets may move this much (s), no hit may be gained or lost
+    references = {}
+    for hit_rate, decay in rolls:
+        signal, _ = synth_hits(hit_rate, duration=10.0, decay=decay)
+        references[hit_rate, decay] = signal, hit_samples(main.OnsetDetector(), signal)
+    print(f"Decimation front-end, {BLOCKSIZE} samples @ {main.RATE} Hz")
+    for factor in (1, 4, 8, 12):
+        detector = main.OnsetDetector(decimation=factor)
+        label = f"decimation {factor:2d} ({main.RATE // factor} Hz)"
+        report(label, per_call_us(detector.process, block))
+        for (hit_rate, decay), (signal, reference) in references.items():
+            hits = hit_samples(main.OnsetDetector(decimation=factor), signal)
+            roll = f"{hit_rate} hits/s, {decay * 1000:.0f} ms decay"
+            if len(hits) == len(reference):
+                shift = np.abs(hits - reference).max() / main.RATE
+                check(shift <= max_shift, f"decimation {factor}, {roll}: hits shifted by {shift * 1000:.3f} ms")
+                print(f"  {roll:<40} same {len(hits)} hits, max time shift {shift * 1000:.3f} ms")
+            else:
+                check(False, f"decimation {factor}, {roll}: {len(hits)} hits vs {len(reference)}")
+                print(f"  {roll:<40} MISMATCH: {len(hits)} hits vs {len(reference)}")
+
+@benchmark("kernel")
+def bench_kernel():
+    """Per-channel detectors vs one vectorized detector bank, NumPy and numba, 1/8/32 channels @ 48 kHz."""
+    print(f"Detector bank, {BLOCKSIZE} frames @ {main.RATE} Hz")
+    paths = [("NumPy", False)] + ([("numba", True)] if main.USE_NUMBA else [])
+    for channels in (1, 8, 32):
+        block = make_blocks(1, channels=channels)[0]
+        for label, use_numba in paths:
+            detectors = [main.OnsetDetector(use_numba=use_numba) for _ in range(channels)]
+            bank = main.OnsetDetector(use_numba=use_numba, channels=channels)
+
+            def per_channel():
+                for channel, detector in enumerate(detectors):
+                    detector.process(block[:, channel])
+
+            report(f"{channels:2d} ch: {label} per channel", per_call_us(per_channel, repeat=50))
+            report(f"{channels:2d} ch: {label} bank", per_call_us(bank.process, block, repeat=50))
+        if not main.USE_NUMBA:
+            print("  numba is not installed, only the NumPy path is available")
+
+def numpy_traced_bytes():
+    """Bytes of NumPy array data tracemalloc currently traces."""
+    snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.DomainFilter(True, np.lib.tracemalloc_domain)])
+    return sum(trace.size for trace in snapshot.traces)
+
+@benchmark("alloc")
+def bench_alloc():
+    """Heap growth per block through ring.pop + detect_hits_detailed, kernel vs NumPy path.
+
+    Fails if, after warm-up, the numba path leaves NumPy array data behind
+    or its peak reaches half a block: an array allocated per block would be
+    at least a block's samples, the rest of the peak is the hit dicts and
+    the Python objects of calling the kernel.
+    """
+    block_bytes = BLOCKSIZE * np.dtype(main.SAMPLE_DTYPE).itemsize
+    print(f"Allocations per block, {BLOCKSIZE} frames ({block_bytes} bytes) @ {main.RATE} Hz")
+    signal, _ = synth_hits(hit_rate=4, duration=6.0)
+    blocks = signal[:len(signal) // BLOCKSIZE * BLOCKSIZE].reshape(-1, BLOCKSIZE, 1)
+    paths = [("NumPy/SciPy", False)] + ([("numba kernel", True)] if main.USE_NUMBA else [])
+    for label, use_numba in paths:
+        detector = main.OnsetDetector(use_numba=use_numba)
+        ring = main.BlockRing(capacity=4, blocksize=BLOCKSIZE)
+        indata = np.empty((BLOCKSIZE, 1), dtype=main.SAMPLE_DTYPE)
+
+        def step(block):
+            ring.push(block, 0.0)
+            ring.pop(indata)
+            main.detect_hits_detailed(indata, main.THRESHOLD, detector=detector)
+
+        for block in blocks[:10]:  # Warm caches and lazily sized buffers
+            step(block)
+        tracemalloc.start()
+        arrays_before = numpy_traced_bytes()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        for block in blocks[10:110]:
+            step(block)
+        after, peak = tracemalloc.get_traced_memory()
+        arrays = numpy_traced_bytes() - arrays_before
+        tracemalloc.stop()
+        print(f"  {label:<12s}: peak {peak - before:7d} bytes over 100 blocks "
+              f"({(peak - before) / block_bytes:4.1f} blocks), net {after - before:+d} bytes, "
+              f"NumPy arrays {arrays:+d} bytes")
+        if use_numba:
+            check(arrays == 0 and peak - before < block_bytes / 2,
+                  f"numba path allocates per block: peak {peak - before} bytes, NumPy arrays {arrays:+d} bytes")
+    if not main.USE_NUMBA:
+        print("  numba is not installed, the allocation-free path is not checked")
+
+@benchmark("stations")
+def bench_stations():
+    """Memory and CPU of N single-device stations in one process vs one process each."""
+    probe = "import resource, main; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    process_kb = int(subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__))).stdout)
+    print(f"One detector process (interpreter + NumPy/SciPy{' + numba' if main.USE_NUMBA else ''}): "
+          f"{process_kb / 1024:.1f} MB RSS")
+    print("  stations   one process each   shared process   detection µs/block per station")
+    for count in (1, 4, 8):
+        tracemalloc.start()
+        inputs = main.open_inputs([None] * count, main.THRESHOLD)
+        input_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        blocks = make_blocks(1)[0]
+        indata = np.empty_like(inputs[0].ring.blocks[0])
+
+        def one_round():
+            for audio_input in inputs:
+                audio_input.callback(blocks, BLOCKSIZE, FakeTimeInfo, None)
+                adc_time = audio_input.ring.pop(indata)
+                audio_input.detect(indata, main.THRESHOLD, adc_time)
+
+        us = per_call_us(one_round, repeat=50) / count
+        print(f"  {count:8d}   {count * process_kb / 1024:13.1f} MB   "
+              f"{(process_kb + input_bytes / 1024) / 1024:11.1f} MB   {us:10.1f}")
+
+def crowd_noise(length, levels, fs=main.RATE, seed=5):
+    """White noise whose level follows ``levels``, (seconds, std) breakpoints."""
+    times, stds = zip(*levels)
+    rng = np.random.default_rng(seed)
+    return (rng.normal(size=length) * np.interp(np.arange(length) / fs, times, stds)).astype(np.float32)
+
+@benchmark("adaptive")
+def bench_adaptive():
+    """Fixed vs adaptive threshold: crowd noise swelling past the fixed threshold, and 30 s fast rolls."""
+    duration = 30.0
+    tolerance = 0.02 * main.RATE
+    signal, onsets = synth_hits(hit_rate=2, duration=duration, amplitude=2.0, noise=0)
+    signal += crowd_noise(len(signal), [(0, 0.05), (8, 0.05), (16, 3.0), (22, 3.0), (30, 0.3)])
+    cases = [("crowd swell, 2 hits/s", signal, onsets, blocksize) for blocksize in (BLOCKSIZE, 64)]
+    # Every roll at the default and at small low-latency blocks: how long a hit's level and hold
+    # take to settle must not depend on where the blocks happen to split it
+    for hit_rate, decay, amplitude in ((8, 0.1, 0.8), (12, 0.05, 0.8), (20, 0.05, 0.8), (10, 0.03, 0.8),
+                                       (7, 0.1, 0.6)):
+        signal, onsets = synth_hits(hit_rate, duration=duration, amplitude=amplitude, decay=decay)
+        cases.extend((f"{hit_rate} hits/s roll, {decay * 1000:.0f} ms decay, {amplitude}", signal, onsets, blocksize)
+                     for blocksize in (BLOCKSIZE, 64, main.LOW_LATENCY_BLOCK, 256))
+    print(f"Hits over {duration:.0f} s: crowd noise swelling past the {main.THRESHOLD} threshold, "
+          f"and rolls that must not raise the noise floor")
+    print("  case                                   block   threshold   detected   true   false   µs/block")
+    for label, signal, onsets, blocksize in cases:
+        results = {}
+        for name, adaptive in (("fixed", False), ("adaptive", True)):
+            detector = main.OnsetDetector(adaptive=adaptive)
+            found = hit_samples(detector, signal, blocksize)
+            true = sum(bool(np.any(np.abs(found - onset) < tolerance)) for onset in onsets)
+            results[name] = true, len(found) - true
+            detector.reset()
+            us = per_call_us(detector.process, signal[:blocksize])
+            print(f"  {label:<37} {blocksize:6d}   {name:<9}   {len(found):8d}   {true:4d}   "
+                  f"{len(found) - true:5d}   {us:8.1f}")
+        (fixed_true, fixed_false), (true, false) = results["fixed"], results["adaptive"]
+        if label.startswith("crowd"):
+            check(true == len(onsets) and false < fixed_false / 4,
+                  f"adaptive threshold, {label} ({blocksize} frames): {true}/{len(onsets)} hits, {false} false vs {fixed_false} fixed")
+        else:
+            check(true >= fixed_true, f"adaptive threshold, {label} ({blocksize} frames): "
+                                      f"{true}/{len(onsets)} hits vs {fixed_true} fixed")
+
+def pa_bass(duration, note_rate=2.0, amplitude=0.6, fs=main.RATE, offset=0.35):
+    """Sustained 150-210 Hz notes with a 10 ms attack, like bass from the PA."""
+    t = np.arange(int(0.15 * fs)) / fs
+    signal = np.zeros(int(duration * fs))
+    for number, start in enumerate(np.arange(offset, duration - 0.3, 1 / note_rate)):
+        note = np.sin(2 * np.pi * (150 + 30 * (number % 3)) * t) * np.minimum(1, t / 0.01)
+        signal[int(start * fs):int(start * fs) + t.size] += amplitude * note
+    return signal.astype(np.float32)
+
+@benchmark("bleed")
+def bench_bleed():
+    """Peak/crest-factor bleed rejection: false hits removed, snares kept and what it costs per block."""
+    duration = 30.0
+    snare, onsets = synth_hits(hit_rate=2, duration=duration)
+    neighbour, _ = synth_hits(hit_rate=1.3, duration=duration, amplitude=0.3, decay=0.08, noise=0, seed=7)
+    signal = snare + np.roll(neighbour, int(0.13 * main.RATE)) + pa_bass(duration)
+    tolerance = 0.02 * main.RATE
+    # Snares alone, with body tones ringing for up to 150 ms and fast rolls: rejection must not drop any of them
+    snares = [(2, 0.05, 0.8), (2, 0.1, 0.8), (2, 0.15, 0.8), (2, 0.1, 2.0), (12, 0.1, 0.8), (16, 0.15, 0.8),
+              (20, 0.05, 0.8), (20, 0.05, 2.0)]
+    print(f"{len(onsets)} snare hits over {duration:.0f} s with neighbouring-kit bleed and PA bass")
+    print("  path     rejection   detected   true   false   µs/block")
+    paths = [("NumPy", False)] + ([("numba", True)] if main.USE_NUMBA else [])
+    for label, use_numba in paths:
+        results = {}
+        for reject_bleed in (False, True):
+            detector = main.OnsetDetector(use_numba=use_numba, reject_bleed=reject_bleed)
+            found = hit_samples(detector, signal)
+            true = sum(bool(np.any(np.abs(found - onset) < tolerance)) for onset in onsets)
+            results[reject_bleed] = (true, len(found) - true)
+            detector.reset()
+            us = per_call_us(detector.process, signal[:BLOCKSIZE])
+            print(f"  {label:<8} {'on' if reject_bleed else 'off':>9}   {len(found):8d}   {true:4d}   "
+                  f"{len(found) - true:5d}   {us:8.1f}")
+        (true_off, false_off), (true_on, false_on) = results[False], results[True]
+        # A bleed hit just before a snare masks it (the snare falls in its refractory time), so allow a few
+        check(true_on >= 0.9 * true_off and false_on < false_off / 10,
+              f"bleed rejection, {label}: {true_on} hits, {false_on} false vs {true_off}, {false_off} without")
+    print("Snares alone (hits found without / with rejection)")
+    for hit_rate, decay, amplitude in snares:
+        roll, onsets = synth_hits(hit_rate=hit_rate, duration=10.0, amplitude=amplitude, decay=decay)
+        counts = []
+        for label, use_numba in paths:
+            for reject_bleed in (False, True):
+                found = hit_samples(main.OnsetDetector(use_numba=use_numba, reject_bleed=reject_bleed), roll)
+                counts.append(sum(bool(np.any(np.abs(found - onset) < tolerance)) for onset in onsets))
+            check(counts[-1] >= counts[-2], f"bleed rejection, {label}: {hit_rate}/s, {decay * 1000:.0f} ms decay, "
+                                            f"amplitude {amplitude}: {counts[-1]} hits vs {counts[-2]} without")
+        row = "   ".join(f"{counts[i]}/{counts[i + 1]} {label}" for i, (label, _) in zip(range(0, len(counts), 2), paths))
+        print(f"  {hit_rate:2d}/s, {decay * 1000:3.0f} ms decay, amplitude {amplitude}: {len(onsets)} hits   {row}")
+
+def synth_drum(hit_rate, frequency, duration, amplitude=1.0, decay=0.15, click=0.05, offset=0.3,
+               fs=main.RATE, seed=1):
+    """Tom/kick-like hits: a decaying tone with a short click, and no snare wires."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(0.5 * fs)) / fs
+    hit = amplitude * (np.sin(2 * np.pi * frequency * t) * np.exp(-t / decay)
+                       + click * rng.normal(size=t.size) * np.exp(-t / 0.003))
+    signal = np.zeros(int(duration * fs))
+    for start in (np.arange(offset, duration - 0.6, 1 / hit_rate) * fs).astype(int):
+        signal[start:start + hit.size] += hit[:signal.size - start]
+    return signal.astype(np.float32)
+
+@benchmark("bands")
+def bench_bands():
+    """Body band alone vs body + wire bands: false hits from toms/kick, snare rolls kept and CPU per block."""
+    duration = 30.0
+    snare, onsets = synth_hits(hit_rate=2, duration=duration)
+    signal = (snare + synth_drum(1.5, 150, duration, seed=1) + synth_drum(1.1, 110, duration, 1.2, 0.2, offset=0.55, seed=2)
+              + synth_drum(2, 60, duration, 1.5, 0.1, 0.2, offset=0.4, seed=3))
+    tolerance = 0.02 * main.RATE
+    # Fast rolls whose body tone rings on under the next hits: the wire band must not drop any of them
+    rolls = [(20, 0.05), (12, 0.1), (16, 0.15), (8, 0.03)]
+    print(f"{len(onsets)} snare hits over {duration:.0f} s with tom and kick hits in the body band")
+    print("  path    decimation   bands   detected   true   false   µs/block")
+    paths = [("NumPy", False)] + ([("numba", True)] if main.USE_NUMBA else [])
+    for label, use_numba in paths:
+        for decimation in (1, 3):
+            false = {}
+            for wire_band in (False, True):
+                detector = main.OnsetDetector(use_numba=use_numba, decimation=decimation, wire_band=wire_band)
+                found = hit_samples(detector, signal)
+                true = sum(bool(np.any(np.abs(found - onset) < tolerance)) for onset in onsets)
+                false[wire_band] = len(found) - true
+                detector.reset()
+                us = per_call_us(detector.process, signal[:BLOCKSIZE])
+                print(f"  {label:<8} {decimation:9d}   {2 if wire_band else 1:5d}   {len(found):8d}   {true:4d}   "
+                      f"{len(found) - true:5d}   {us:8.1f}")
+            check(true == len(onsets) and false[True] < false[False] / 10,
+                  f"wire band, {label}, decimation {decimation}: {true}/{len(onsets)} hits, "
+                  f"{false[True]} false vs {false[False]} with the body band alone")
+    print("Snare rolls (hits found with the body band alone / with the wire band)")
+    for hit_rate, decay in rolls:
+        roll, onsets = synth_hits(hit_rate=hit_rate, duration=10.0, decay=decay)
+        row = []
+        for label, use_numba in paths:
+            for decimation in (1, 3):
+                counts = []
+                for wire_band in (False, True):
+                    detector = main.OnsetDetector(use_numba=use_numba, decimation=decimation, wire_band=wire_band)
+                    found = hit_samples(detector, roll)
+                    counts.append(sum(bool(np.any(np.abs(found - onset) < tolerance)) for onset in onsets))
+                check(counts[1] >= counts[0], f"wire band, {label}, decimation {decimation}: {hit_rate}/s roll, "
+                                              f"{decay * 1000:.0f} ms decay: {counts[1]} hits vs {counts[0]}")
+                row.append(f"{counts[0]}/{counts[1]} {label}÷{decimation}")
+        print(f"  {hit_rate:2d}/s, {decay * 1000:3.0f} ms decay: {len(onsets)} hits   " + "   ".join(row))
+
+@benchmark("flux")
+def bench_flux():
+    """Spectral-flux vs RMS detector: CPU, allocations, hits found and onset timing."""
+    print(f"Spectral flux vs RMS detector, {BLOCKSIZE} frames @ {main.RATE} Hz")
+    detectors = {"rms": lambda: main.create_detector(), "flux": lambda: main.create_detector(method="flux")}
+    block = make_blocks(1)[0]
+    for label, create in detectors.items():
+        detector = create()
+        report(f"{label:<4} process", per_call_us(detector.process, block))
+        for _ in range(10):
+            detector.process(block)
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        for _ in range(100):
+            detector.process(block)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{'':43s}peak {peak - before} bytes over 100 blocks")
+    print("  hits/s   decay   played   rms found  error ms   flux found  error ms")
+    for hit_rate in (5, 10, 20, 25):
+        for decay in (0.03, 0.10):
+            signal, onsets = synth_hits(hit_rate, decay=decay)
+            row = f"  {hit_rate:6d}    {decay:4.2f}   {len(onsets):6d}"
+            for create in detectors.values():
+                found = hit_samples(create(), signal)
+                errors = [found[np.argmin(np.abs(found - onset))] - onset for onset in onsets] if len(found) else [0]
+                row += f"   {len(found):9d}  {np.mean(errors) / main.RATE * 1000:4.1f}±{np.std(errors) / main.RATE * 1000:3.1f}"
+            print(row)
+
+def detection_delays(detector, signal, onsets, blocksize):
+    """Seconds from each played onset to the end of the block its hit was reported in."""
+    reported = [(start + offset, start + blocksize)
+                for start in range(0, len(signal), blocksize)
+                for _, offset, _ in detector.process(signal[start:start + blocksize])]
+    found = np.array([sample for sample, _ in reported])
+    delays = []
+    for onset in onsets:
+        nearest = np.argmin(np.abs(found - onset))
+        if abs(found[nearest] - onset) < 0.02 * main.RATE:
+            delays.append((reported[nearest][1] - onset) / main.RATE)
+    return np.array(delays)
+
+async def measure_pipeline(blocksize, duration=3.0):
+    """Feed a snare roll through an ``AudioInput`` in real time and return attack-to-receive latencies (s)."""
+    import websockets
+
+    signal, _ = synth_hits(8, duration=duration)
+    audio_input, = main.open_inputs([None], main.THRESHOLD, detector_options={"method": "rms"}, blocksize=blocksize)
+    audio_input.ring.attach_loop(asyncio.get_running_loop())
+    main.audio_inputs = [audio_input]
+    main.latency_meter.onset_delay = main.onset_delay(audio_input.detector)
+    latencies = []
+
+    def feed():
+        interval = blocksize / main.RATE
+        due = time.perf_counter()
+        for start in range(0, len(signal) - blocksize + 1, blocksize):
+            due += interval
+            time.sleep(max(0.0, due - time.perf_counter()))
+            audio_input.callback(signal[start:start + blocksize, None], blocksize, FakeTimeInfo, None)
+
+    async def detect():
+        indata = np.empty_like(audio_input.ring.blocks[0])
+        while True:
+            adc_time = await audio_input.ring.get_async(indata)
+            for hit_data in audio_input.detect(indata, main.THRESHOLD, adc_time):
+                main.broadcaster.publish(hit_data)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        async with websockets.serve(main.handle_client, "localhost", 0) as server:
+            async with websockets.connect(f"ws://localhost:{server.sockets[0].getsockname()[1]}") as websocket:
+                await websocket.recv()  # "connected"
+                detector_task = asyncio.create_task(detect())
+                feeder = threading.Thread(target=feed, daemon=True)
+                feeder.start()
+                try:
+                    while True:
+                        event = json.loads(await asyncio.wait_for(websocket.recv(), 0.5))
+                        latencies.append(time.time() - event["timestamp"] + main.latency_meter.onset_delay)
+                except asyncio.TimeoutError:
+                    pass
+                detector_task.cancel()
+    main.audio_inputs = []
+    return np.array(latencies)
+
+@benchmark("latency")
+def bench_latency():
+    """Detection delay and end-to-end attack-to-send latency for 50 ms vs low-latency blocks."""
+    signal, onsets = synth_hits(8)
+    print("Onset to hit available (block wait + detector delay + processing), 8 hits/s")
+    print("  block   detector   found   µs/block   mean ms    p95 ms    max ms")
+    for blocksize in (BLOCKSIZE, 256, main.LOW_LATENCY_BLOCK, 64):
+        for method in ("rms", "flux"):
+            us = per_call_us(main.create_detector(method=method).process, make_blocks(1, blocksize)[0])
+            delays = detection_delays(main.create_detector(method=method), signal, onsets, blocksize) + us / 1e6
+            print(f"  {blocksize:5d}   {method:<8} {len(delays):5d}/{len(onsets)}   {us:8.1f}   "
+                  f"{delays.mean() * 1000:7.2f}   {np.percentile(delays, 95) * 1000:7.2f}   {delays.max() * 1000:7.2f}")
+    for method in ("rms", "flux"):
+        detector = main.create_detector(method=method)
+        found = hit_samples(detector, signal)
+        lags = [found[np.argmin(np.abs(found - onset))] - onset for onset in onsets]
+        print(f"  {method} onset stamp after the attack: {main.onset_delay(detector) * 1000:.1f} ms estimated, "
+              f"median {np.median(lags) / main.RATE * 1000:.1f} ms on the roll")
+    print(f"Live pipeline over localhost, rms detector: attack -> onset stamp -> ring -> detect -> WebSocket "
+          f"client (target {main.LATENCY_TARGET * 1000:.0f} ms)")
+    print("  block   hits   mean ms    p95 ms    max ms   server p95 ms")
+    for blocksize in (BLOCKSIZE, main.LOW_LATENCY_BLOCK):
+        main.latency_meter.reset()
+        latencies = asyncio.run(measure_pipeline(blocksize))
+        server = main.latency_meter.summary()
+        print(f"  {blocksize:5d}   {len(latencies):4d}   {latencies.mean() * 1000:7.2f}   "
+              f"{np.percentile(latencies, 95) * 1000:7.2f}   {latencies.max() * 1000:7.2f}   "
+              f"{server['p95'] * 1000:13.2f}")
+
+@benchmark("sessions")
+def bench_sessions():
+    """Dispatching hits to dozens of concurrent game sessions: station index vs offering every hit to every session."""
+    rng = np.random.default_rng(0)
+    onsets = np.sort(rng.uniform(0, 30, 5000))
+    print(f"Game sessions: a ranked and a practice game per station plus 2 scoring every station, "
+          f"{onsets.size} hits in 30 s")
+    print("  sessions   stations   scan µs/hit   registry µs/hit   same scores")
+    for stations in (4, 16, 48):
+        hits = list(zip(rng.integers(stations, size=onsets.size).tolist(), onsets.tolist()))
+
+        def open_sessions():
+            sessions = []
+            for station in [None, None] + [station for station in range(stations) for _ in range(2)]:
+                session = main.GameSession(30.0, None if station is None else {station}, settle=0.0,
+                                           refractory=0.05 if len(sessions) % 2 else 0.0)
+                session.start, session.end = 0.0, 30.0  # On the synthetic clock of the hits
+                sessions.append(session)
+            return sessions
+
+        # Before the registry: every hit offered to every open session
+        scanned = open_sessions()
+        start = time.perf_counter()
+        for station, onset in hits:
+            for session in scanned:
+                session.record(station, onset)
+        scan_us = (time.perf_counter() - start) / len(hits) * 1e6
+
+        routed = open_sessions()
+        registry = main.SessionRegistry()
+        for session in routed:
+            registry.add(session)
+        start = time.perf_counter()
+        for station, onset in hits:
+            registry.dispatch(station, onset)
+        routed_us = (time.perf_counter() - start) / len(hits) * 1e6
+
+        same = [session.station_hits for session in scanned] == [session.station_hits for session in routed]
+        print(f"  {len(routed):8d}   {stations:8d}   {scan_us:11.2f}   {routed_us:15.2f}   {'yes' if same else 'NO'}")
+
+async def measure_replay(missed, binary=False, history=main.REPLAY_CAPACITY):
+    """Disconnect a client, publish ``missed`` hits, reconnect it with its last seq.
+
+    Returns the seqs it got on reconnecting, the ``connected`` message and
+    how long (s) from reconnecting until the last missed hit arrived.
+    """
+    import websockets
+
+    main.broadcaster = main.HitBroadcaster(history=history)
+    subprotocols = [main.BINARY_SUBPROTOCOL] if binary else None
+    hit = sample_hit()
+
+    def seqs_of(message):
+        if isinstance(message, bytes):
+            return [record[5] for record in main.HIT_RECORD.iter_unpack(message)]
+        event = json.loads(message)
+        return [event["seq"] for event in event.get("events", [event])]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        async with websockets.serve(main.handle_client, "localhost", 0, subprotocols=[main.BINARY_SUBPROTOCOL],
+                                    select_subprotocol=main.select_subprotocol) as server:
+            uri = f"ws://localhost:{server.sockets[0].getsockname()[1]}"
+            async with websockets.connect(uri, subprotocols=subprotocols) as websocket:
+                epoch = json.loads(await websocket.recv())["epoch"]
+                for _ in range(5):
+                    main.broadcaster.publish(dict(hit))
+                seen = []
+                while len(seen) < 5:
+                    seen += seqs_of(await websocket.recv())
+            for _ in range(missed):  # While the client is away
+                main.broadcaster.publish(dict(hit))
+            start = time.perf_counter()
+            async with websockets.connect(f"{uri}/?last_seq={seen[-1]}&epoch={epoch}",
+                                          subprotocols=subprotocols) as websocket:
+                connected = json.loads(await websocket.recv())
+                main.broadcaster.publish(dict(hit))  # Published after reconnecting
+                replayed = []
+                while not replayed or replayed[-1] < main.broadcaster.seq:
+                    replayed += seqs_of(await websocket.recv())
+                elapsed = time.perf_counter() - start
+    main.broadcaster = main.HitBroadcaster()
+    return replayed, connected, elapsed
+
+@benchmark("replay")
+def bench_replay():
+    """Reconnecting with the last seq: exactly the missed hits come back, and how quickly."""
+    print(f"Client away while hits are published, then reconnecting with last_seq "
+          f"(ring of {main.REPLAY_CAPACITY} events)")
+    print("  protocol   missed   got   exactly the missed   resync   missed too old   reconnect to caught up ms")
+    for binary in (False, True):
+        for missed in (0, 10, main.REPLAY_CAPACITY - 1, 2 * main.REPLAY_CAPACITY):
+            replayed, connected, elapsed = asyncio.run(measure_replay(missed, binary))
+            kept = min(missed, main.REPLAY_CAPACITY)  # The rest has left the ring
+            expected = list(range(6 + missed - kept, 7 + missed))  # Plus the hit published after reconnecting
+            print(f"  {'binary' if binary else 'json':<8}   {missed:6d}   {len(replayed):4d}   "
+                  f"{'yes' if replayed == expected else 'NO':>18}   {'yes' if connected['resync'] else 'no':>6}   "
+                  f"{connected['missed']:14d}   {elapsed * 1000:25.2f}")
+
+# =========================
+# Main Entrypoint
+# =========================
+def main_cli():
+    parser = argparse.ArgumentParser(description="Snare drum detector microbenchmarks")
+    parser.add_argument('names', nargs='*', metavar='name',
+                        help=f"Benchmarks to run (default: all): {', '.join(BENCHMARKS)}")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name]()
+        print()
+
+    for failure in FAILURES:
+        print(f"❌ {failure}")
+    return 1 if FAILURES else 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -1,94 +1,1005 @@
 import argparse
 import asyncio
+import glob
 import json
+import math
+import os
+import struct
 import sounddevice as sd
+import soundfile as sf
 import numpy as np
-import queue
+import threading
 import time
 import sys
 import websockets
-from typing import Set, Optional, Dict, Any
-from scipy.signal import butter, lfilter
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from itertools import chain, groupby
+from pathlib import Path
+from typing import Set, Optional, Dict, Any, List
+from urllib.parse import parse_qs, urlparse
+from scipy.signal import butter, firwin, lfilter, sosfilt
+
+try:
+    from numba import njit
+except ImportError:  # Optional: detection falls back to the NumPy path
+    njit = None
 
 # Parameters
 THRESHOLD = 0.2       # RMS threshold
 PEAK_THRESHOLD = 0.4  # Peak threshold to filter out bleed
+MIN_CREST = 1.7       # Broadband peak/RMS a hit's start needs to count as a snare (a sine is 1.41)
+BLEED_WINDOW = 0.01   # Start of a hit whose peak and crest factor are checked (s)
 BLOCK_DURATION = 0.05 # 50 ms blocks
+LOW_LATENCY_BLOCK = 128  # Frames per block in low-latency mode (2.7 ms)
+LATENCY_TARGET = 0.01 # Attack-to-send latency low-latency mode aims for (s)
+ONSET_PROBE_LEVEL = 1.5  # Reference hit for the onset delay, in times the threshold (quieter hits trigger later)
+LATENCY_WINDOW = 1000 # Recent deliveries the reported latency covers
 RATE = 48000
 CHANNELS = 1
-
-q = queue.Queue()
-hit_count = 0
-last_hit_time = 0
+LOWCUT = 120          # Snare body band (Hz)
+HIGHCUT = 250
+WIRE_LOWCUT = 2000    # Snare wire/crack band (Hz), used with the two-band detector
+WIRE_HIGHCUT = 6000
+WIRE_SHARE = 0.1      # Wire band power a hit's attack needs, relative to the threshold power (toms/kick have ~none)
+WIRE_HOLD = 0.015     # A wire attack lets the body band trigger for this long after it (s)
+REFRACTORY = 0.03     # Minimum gap between two hits (caps counting at ~33 hits/s)
+LEVEL_WINDOW = 0.01   # A hit's level is its peak over this long from the onset (s), reported once it has passed
+FAST_ENVELOPE = 0.002 # Fast envelope time constant, follows the attack
+SLOW_ENVELOPE = 0.02  # Slow envelope time constant, follows the decay
+ONSET_RATIO = 1.5     # Fast/slow power ratio that marks an attack
+FLUX_FRAME = 0.02     # Spectral-flux detector: analysis frame (s), rounded to a power of two
+FLUX_HOPS = 4         # Frames per FLUX_FRAME, so consecutive frames overlap by 75%
+NOISE_MARGIN = 4.0    # Adaptive threshold: RMS margin above the noise floor
+NOISE_RISE = 5.0      # Time constant of the noise floor rising (crowd getting louder)
+NOISE_FALL = 0.5      # Time constant of the noise floor falling (noise stopped)
+NOISE_HOLD = 0.4      # The noise floor does not rise for this long (s) after a hit's onset, while it dies away,
+NOISE_HOLD_LEVEL = 1.5  # if the hit was this many times the threshold (noise just crossing it does not hold)
+IDLE_GRACE = 10.0     # Seconds to keep capturing after the last client leaves
+OUTBOX_CAPACITY = 256 # Messages queued per client before its slow-client policy applies
+MAX_LAG = 0.5         # Oldest undelivered message age (s) that gets a client disconnected
+SLOW_CLIENT_POLICIES = ("drop-oldest", "coalesce", "disconnect")
+SESSION_MAX = 3600.0  # Longest game session a client can start (s)
+SESSION_SETTLE = 0.1  # Wait after a session closes, on top of detection delay, before scoring it (s)
+REPLAY_CAPACITY = 1024  # Recent events kept to replay to reconnecting clients
+RESUMABLE_SESSIONS = 64  # Sessions of disconnected clients (or finished) kept for them to resume
+BINARY_SUBPROTOCOL = "snare.hits.v2"  # WebSocket subprotocol of the binary hit records
+HIT_RECORD = struct.Struct("<BxHHhIIddff")  # kind, station, channel, device, hit number, seq, timestamp, stream time, RMS, threshold
+RECORD_HIT = 1        # HIT_RECORD kind of a hit
+RING_CAPACITY = 20    # Audio blocks buffered between the callback and detection (1 s, same time for smaller blocks)
+SHARD_WARMUP = 2.0    # Seconds of audio a file shard is warmed up on before its start
+DECIMATION = 1        # Downsampling factor ahead of the band filter (1 = off, 12 = 4 kHz)
+DECIMATION_TAPS = 16  # Anti-alias FIR taps per polyphase branch
+SAMPLE_DTYPE = np.float32  # Precision of live audio blocks and detector state
+ANALYSIS_DTYPE = np.float64  # Precision of offline file analysis (see scan_recording)
 
 # =========================
 # Bandpass Filter Utilities
 # =========================
-def bandpass_filter(data, lowcut=120, highcut=250, fs=RATE, order=4):
-    """Apply a bandpass filter to isolate snare frequencies (≈120–250 Hz)."""
+@lru_cache(maxsize=None)
+def design_bandpass(lowcut=LOWCUT, highcut=HIGHCUT, fs=RATE, order=4):
+    """Design (once) the second-order sections of a Butterworth bandpass."""
     nyquist = 0.5 * fs
-    low = lowcut / nyquist
-    high = highcut / nyquist
-    b, a = butter(order, [low, high], btype='band')
-    return lfilter(b, a, data)
-    
+    # The returned array is shared by every caller of the cache: don't modify it.
+    return butter(order, [lowcut / nyquist, highcut / nyquist], btype='band', output='sos')
+
+@lru_cache(maxsize=None)
+def design_filter_bank(bands=((LOWCUT, HIGHCUT),), fs=RATE, order=4):
+    """Design (once) a bank of Butterworth bandpasses as one (bands, sections, 6) array."""
+    # Shared by every caller of the cache like design_bandpass: don't modify it.
+    return np.stack([design_bandpass(lowcut, highcut, fs, order) for lowcut, highcut in bands])
+
+class FilterBank:
+    """Stateful bank of bandpass filters run over the same blocks.
+
+    All bands have the same order, so their sections and delay lines stack
+    into single (bands, sections, ...) arrays: one design, one state and,
+    in ``detection_kernel``, one pass per sample over every band. The NumPy
+    path still needs one ``sosfilt`` call per band, as ``sosfilt`` applies a
+    single cascade. Blocks are (frames, channels); the output is (bands,
+    frames, channels).
+    """
+
+    def __init__(self, bands=((LOWCUT, HIGHCUT),), fs=RATE, order=4, dtype=SAMPLE_DTYPE, channels=CHANNELS):
+        self.bands = bands
+        self.sos = design_filter_bank(tuple(bands), fs, order).astype(dtype)
+        self.channels = channels
+        self.reset()
+
+    def reset(self):
+        """Forget the filter history (e.g. when a new capture starts)."""
+        bands, sections = self.sos.shape[:2]
+        self.zi = np.zeros((bands, sections, 2, self.channels), dtype=self.sos.dtype)
+
+    def __call__(self, data):
+        filtered = np.empty((len(self.sos),) + data.shape, dtype=self.sos.dtype)
+        for band, sos in enumerate(self.sos):
+            filtered[band], self.zi[band] = sosfilt(sos, data, axis=0, zi=self.zi[band])
+        return filtered
+
+class Decimator:
+    """Stateful polyphase anti-alias filter and downsampler.
+
+    Only every ``factor``-th output of the FIR is computed, so the cost is
+    ``taps_per_phase`` multiplies per input sample whatever the factor. The
+    input is viewed as rows of ``factor`` samples (one column per polyphase
+    branch); one matrix product filters every row with every branch and the
+    outputs are the sums along its diagonals. The last ``len(taps) - 1``
+    input samples and the phase of the next output are carried between
+    blocks. Blocks are (frames, channels); channels are filtered together
+    in one stacked product. Work buffers are reused, so a steady block size
+    allocates nothing.
+    """
+
+    def __init__(self, factor, fs=RATE, taps_per_phase=DECIMATION_TAPS, dtype=SAMPLE_DTYPE, channels=1):
+        self.factor = factor
+        self.dtype = dtype
+        self.channels = channels
+        self.branches = taps_per_phase
+        # Pass band up to 80% of the decimated Nyquist frequency
+        self.taps = firwin(factor * taps_per_phase, 0.8 * fs / factor / 2, fs=fs)
+        # kernel[j * factor + r] (the time-reversed taps) lands in column j, row r
+        self.kernel = np.ascontiguousarray(self.taps[::-1].reshape(taps_per_phase, factor).T, dtype=dtype)
+        self.delay = (len(self.taps) - 1) / 2  # Group delay in input samples
+        self.reset()
+
+    def reset(self, position=0):
+        """Forget the history; the next block starts at absolute sample ``position``.
+
+        Outputs stay on every ``factor``-th sample from sample 0 wherever
+        the input starts.
+        """
+        # Channel-major, so every channel's samples can be viewed as rows of ``factor``
+        self.buffer = np.zeros((self.channels, len(self.taps) - 1), dtype=self.dtype)
+        self.phase = -position % self.factor  # Offset in the next block of its first output sample
+
+    def __call__(self, data):
+        """Return (decimated block, input offset of its first sample).
+
+        The decimated (frames, channels) block is a view of a work buffer,
+        valid until the next call.
+        """
+        history = len(self.taps) - 1
+        frames = len(data)
+        if self.buffer.shape[1] != history + frames:
+            padding = np.zeros((self.channels, frames), dtype=self.dtype)
+            self.buffer = np.concatenate((self.buffer[:, :history], padding), axis=1)
+            rows = -(-frames // self.factor)
+            self.products = np.empty((self.channels, rows + self.branches, self.branches), dtype=self.dtype)
+            self.decimated = np.empty((self.channels, rows), dtype=self.dtype)
+        self.buffer[:, history:] = data.T
+        first = self.phase
+        outputs = len(range(first, frames, self.factor))
+        rows = self.buffer[:, first:first + (outputs + self.branches - 1) * self.factor]
+        products = self.products[:, :outputs + self.branches - 1]
+        np.matmul(rows.reshape(self.channels, -1, self.factor), self.kernel, out=products)
+        # Output k is the sum of products[c, k + j, j] over the branches j
+        size = products.itemsize
+        diagonals = np.lib.stride_tricks.as_strided(
+            products, shape=(self.channels, outputs, self.branches),
+            strides=(products.strides[0], self.branches * size, (self.branches + 1) * size))
+        decimated = np.sum(diagonals, axis=2, out=self.decimated[:, :outputs])
+        self.buffer[:, :history] = self.buffer[:, frames:]
+        self.phase = (first - frames) % self.factor
+        return decimated.T, first
+
+# =========================
+# Audio Ring Buffer
+# =========================
+class BlockRing:
+    """Preallocated single-producer/single-consumer ring of audio blocks.
+
+    The PortAudio callback copies each block into the next slot without
+    allocating, and the consumer copies it out into its own buffer. Neither
+    side takes a lock: each index is only written by one side. When the
+    consumer falls more than ``capacity`` blocks behind, the oldest blocks are
+    overwritten; the consumer notices, skips them and counts them in
+    ``overruns``.
+    """
+
+    def __init__(self, capacity=RING_CAPACITY, blocksize=int(RATE * BLOCK_DURATION), channels=CHANNELS):
+        self.capacity = capacity
+        self.blocks = np.zeros((capacity, blocksize, channels), dtype=SAMPLE_DTYPE)
+        self.times = np.zeros(capacity)
+        self.claimed = 0    # Blocks the producer has started writing (producer only)
+        self.written = 0    # Blocks the producer has finished writing (producer only)
+        self.read = 0       # Blocks the consumer has taken (consumer only)
+        self.overruns = 0   # Blocks dropped because the consumer fell behind (consumer only)
+        self._ready = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_ready: Optional[asyncio.Event] = None
+        self._waiting = False
+
+    @property
+    def fill_level(self):
+        """Number of blocks waiting to be consumed."""
+        return min(self.written - self.read, self.capacity)
+
+    def attach_loop(self, loop: asyncio.AbstractEventLoop):
+        """Wake an asyncio consumer (see ``get_async``) instead of a thread."""
+        self._loop = loop
+        self._async_ready = asyncio.Event()
+
+    def push(self, indata, adc_time):
+        """Producer side: store one block and wake the consumer."""
+        index = self.written
+        slot = index % self.capacity
+        self.claimed = index + 1
+        self.blocks[slot] = indata
+        self.times[slot] = adc_time
+        self.written = index + 1
+        if self._loop is None:
+            self._ready.set()
+        elif self._waiting:
+            self._waiting = False
+            self._loop.call_soon_threadsafe(self._async_ready.set)
+
+    def pop(self, out):
+        """Consumer side: copy the oldest block into ``out`` and return its ADC time.
+
+        Returns None when the ring is empty.
+        """
+        while True:
+            if self.written == self.read:
+                return None
+            if self.written - self.read > self.capacity:
+                # Lapped by the producer: drop the overwritten blocks
+                self.overruns += self.written - self.capacity - self.read
+                self.read = self.written - self.capacity
+            slot = self.read % self.capacity
+            out[:] = self.blocks[slot]
+            adc_time = self.times[slot]
+            if self.claimed - self.read > self.capacity:
+                continue  # The slot was overwritten while copying it
+            self.read += 1
+            return adc_time
+
+    def get(self, out):
+        """Blocking ``pop`` for a consumer thread."""
+        while True:
+            self._ready.clear()
+            adc_time = self.pop(out)
+            if adc_time is not None:
+                return adc_time
+            self._ready.wait()
+
+    async def get_async(self, out):
+        """``pop`` that awaits the next block without polling."""
+        while True:
+            self._async_ready.clear()
+            self._waiting = True
+            adc_time = self.pop(out)
+            if adc_time is not None:
+                self._waiting = False
+                return adc_time
+            await self._async_ready.wait()
+
 # =========================
 # Audio Detection
 # =========================
-def audio_callback(indata, frames, time_info, status):
-    """Collect audio blocks into a queue."""
-    if status:
-        print(status)
-    q.put(indata.copy())
+class StreamClock:
+    """Map PortAudio stream time onto wall-clock (epoch) time.
 
-def detect_hits(indata, threshold=THRESHOLD):
-    """Detect snare hits using bandpass-filtered signal."""
-    global last_hit_time
+    Stream time is monotonic and is what ADC timestamps are expressed in, so
+    hits are timed and spaced in it; the offset to ``time.time()`` is tracked
+    so payloads can still be compared across clients, and the offset to
+    ``time.monotonic()`` so hits can be placed in game sessions.
+    """
 
-    # Use first channel if stereo
-    channel_data = indata[:, 0] if indata.ndim > 1 else indata
+    SMOOTHING = 0.05  # EMA weight of each new offset observation
 
-    # print(channel_data)
-    # channel_data = np.array([(x if abs(x) > 1 else 0) for x in channel_data])
-    # print(np.abs(channel_data))
+    def __init__(self):
+        self.offset = None
+        self.monotonic_offset = None
 
-    # Apply bandpass filter
-    filtered = bandpass_filter(channel_data)
+    def observe(self, stream_time):
+        """Record that ``stream_time`` is now."""
+        offset = time.time() - stream_time
+        monotonic_offset = time.monotonic() - stream_time
+        if self.offset is None:
+            self.offset = offset
+            self.monotonic_offset = monotonic_offset
+        else:
+            self.offset += self.SMOOTHING * (offset - self.offset)
+            self.monotonic_offset += self.SMOOTHING * (monotonic_offset - self.monotonic_offset)
 
-    # RMS after filtering
-    rms = np.sqrt(np.mean(filtered**2))
+    def to_wall(self, stream_time):
+        """Convert a stream time to wall-clock seconds since the epoch."""
+        if self.offset is None:
+            # No stream yet: stream times come from the monotonic fallback
+            self.observe(time.monotonic())
+        return stream_time + self.offset
 
-    now = time.time()
-    if rms > threshold and (now - last_hit_time) > 0.15:  # avoid double-counting
-        last_hit_time = now
-        return True
-    return False
+    def to_monotonic(self, stream_time):
+        """Convert a stream time to ``time.monotonic()`` seconds."""
+        if self.monotonic_offset is None:
+            self.observe(time.monotonic())
+        return stream_time + self.monotonic_offset
 
-def detect_hits_detailed(indata, threshold=THRESHOLD):
-    """Detect snare hits with bandpass filtering and return detailed info."""
-    global last_hit_time, hit_count
+stream_clock = StreamClock()
 
-    # Use first channel if stereo
-    channel_data = indata[:, 0] if indata.ndim > 1 else indata
+def block_adc_time(frames, time_info, clock=stream_clock):
+    """Return the stream time of a callback block's first sample."""
+    # Some host APIs leave the stream timestamps at zero; fall back to the monotonic clock
+    now = time_info.currentTime or time.monotonic()
+    clock.observe(now)
+    return time_info.inputBufferAdcTime or now - frames / RATE
 
-    # Apply bandpass filter
-    filtered = bandpass_filter(channel_data)
+def envelope_coefficients(time_constant, fs=RATE):
+    """Return (b, a) of a one-pole smoother with the given time constant."""
+    alpha = 1.0 - np.exp(-1.0 / (time_constant * fs))
+    return np.array([alpha]), np.array([1.0, alpha - 1.0])
 
-    # RMS after filtering
-    rms = np.sqrt(np.mean(filtered**2))
+class BleedGate:
+    """Reject hits that are bleed rather than the snare in front of the mic.
 
-    now = time.time()
-    if rms > threshold and (now - last_hit_time) > 0.15:
-        last_hit_time = now
-        hit_count += 1
-        return {
+    Bleed from neighbouring kits arrives quieter and never reaches
+    ``peak_threshold`` in the band; PA bass arrives as sustained tones whose
+    crest factor (peak / RMS) stays close to a sine's. Both are checked over
+    the first ``window`` samples of each hit: the peak on the band-filtered
+    signal, the crest factor on the broadband input at its full rate (before
+    any ``decimation``). A snare's attack is a burst of noise from the stick
+    and wires on top of the body tone, while in the body band alone even a
+    snare starts out almost as a sine when its tone rings for long.
+
+    A hit is held until its window has been seen, up to a block later. Hits
+    may also come in up to ``lookback`` frames after their onset. The last
+    samples of both signals of every channel are carried over, and all hits
+    that are ready are judged at once on a stack of windows.
+    """
+
+    def __init__(self, window, channels=CHANNELS, peak_threshold=PEAK_THRESHOLD, min_crest=MIN_CREST,
+                 dtype=SAMPLE_DTYPE, decimation=1, delay=0.0, lookback=0):
+        self.window = window
+        self.history = window - 1 + lookback  # Frames kept from earlier blocks
+        self.span = window * decimation  # Window length at the input rate
+        # Back to the oldest pending onset
+        self.broadband_history = self.span + (lookback + 1) * decimation + math.ceil(delay)
+        self.channels = channels
+        self.peak_threshold = peak_threshold
+        self.min_crest = min_crest
+        self.dtype = dtype
+        self.reset()
+
+    def reset(self, position=0):
+        self.buffer = np.zeros((self.channels, self.history), dtype=self.dtype)  # Channel-major history
+        self.broadband = np.zeros((self.channels, self.broadband_history), dtype=self.dtype)
+        self.frames = 0     # Frames fed so far
+        self.samples = position  # Absolute input sample of the next block
+        self.pending = []   # (channel, frame, input sample, hit) still waiting for the end of their window
+
+    @staticmethod
+    def _append(buffer, history, block):
+        """Shift ``block`` (frames, channels) into a channel-major buffer keeping ``history`` columns."""
+        frames = len(block)
+        if buffer.shape[1] != history + frames:
+            grown = np.zeros((buffer.shape[0], history + frames), dtype=buffer.dtype)
+            grown[:, :history] = buffer[:, buffer.shape[1] - history:]
+            buffer = grown
+        else:
+            buffer[:, :history] = buffer[:, frames:]
+        buffer[:, history:] = block.T
+        return buffer
+
+    def feed(self, filtered):
+        """Append one (frames, channels) block of the filtered signal."""
+        self.buffer = self._append(self.buffer, self.history, filtered)
+        self.frames += len(filtered)
+
+    def feed_broadband(self, block):
+        """Append one (samples, channels) input block, at the input rate."""
+        self.broadband = self._append(self.broadband, self.broadband_history, block)
+        self.samples += len(block)
+
+    def judge(self, hits):
+        """Queue hits of the block just fed, as (channel, frame in block, input sample, hit).
+
+        Returns the ``hit`` of every queued hit whose window is complete and
+        that passed, in time order.
+        """
+        start = self.frames - self.buffer.shape[1]  # Frame of buffer column 0
+        block_start = self.frames - (self.buffer.shape[1] - self.history)
+        self.pending.extend((channel, block_start + index, sample, hit) for channel, index, sample, hit in hits)
+        ready = 0
+        while (ready < len(self.pending) and self.pending[ready][1] + self.window <= self.frames
+               and self.pending[ready][2] + self.span <= self.samples):
+            ready += 1
+        if not ready:
+            return []
+        judged, self.pending = self.pending[:ready], self.pending[ready:]
+        channels = np.array([channel for channel, _, _, _ in judged])
+        columns = np.array([frame - start for _, frame, _, _ in judged])
+        band = np.lib.stride_tricks.sliding_window_view(self.buffer, self.window, axis=1)[channels, columns]
+        peaks = np.abs(band).max(axis=1)
+        columns = np.array([sample for _, _, sample, _ in judged]) - (self.samples - self.broadband.shape[1])
+        broadband = np.lib.stride_tricks.sliding_window_view(self.broadband, self.span, axis=1)[channels, columns]
+        crest = np.abs(broadband).max(axis=1) / np.sqrt(np.square(broadband).mean(axis=1))
+        passed = (peaks >= self.peak_threshold) & (crest >= self.min_crest)
+        return [hit for (_, _, _, hit), ok in zip(judged, passed) if ok]
+
+# =========================
+# Compiled Detection Kernel
+# =========================
+NO_ONSET = np.iinfo(np.int64).min  # last_onset of a channel that has not hit yet
+
+def new_kernel_state(sections, channels, dtype=SAMPLE_DTYPE, bands=1):
+    """Allocate the per-channel state arrays ``detection_kernel`` carries between blocks.
+
+    Returns (zi, envelopes, triggered, last_onset, band_onsets, open_onsets, peaks).
+    """
+    return (np.zeros((channels, bands, sections, 2), dtype=dtype),  # Biquad delay lines
+            np.zeros((channels, bands, 2), dtype=dtype),            # Fast/slow envelope states
+            np.zeros(channels, dtype=np.bool_),         # Onset condition at the end of the block
+            np.full(channels, NO_ONSET, dtype=np.int64),  # Absolute sample of the last hit
+            np.full((channels, bands), NO_ONSET, dtype=np.int64),  # Last attack sample of each other band
+            np.full(channels, NO_ONSET, dtype=np.int64),  # Onset of the hit still collecting its level
+            np.zeros(channels, dtype=dtype))            # Its peak fast-envelope power so far
+
+def detection_kernel(data, sos, zi, envelopes, triggered, last_onset, band_onsets, open_onsets, peaks, origin,
+                     step, thresholds2, ratio, share, hold, fast_alpha, fast_decay, slow_alpha, slow_decay,
+                     refractory, window, onsets, levels, quietest, filtered):
+    """Run the whole detector over a (frames, channels) block in one pass per sample.
+
+    Per sample and channel: the biquad cascade of every band in ``sos``
+    (transposed direct form II, like ``sosfilt``), each band's power
+    envelopes (same state convention as ``lfilter``), the test of the first
+    (body) band against the channel's power threshold and the onset ratio,
+    the check that every other band had an attack of its own (onset ratio,
+    and ``share`` of the threshold power) at most ``hold`` samples before,
+    and the refractory check. Frame ``i`` is absolute sample
+    ``origin + i * step``. A hit stays open, across blocks if need be, until
+    ``window`` samples after its onset (or the channel's next hit), collecting
+    its peak fast-envelope power. Closed hits are written to ``onsets`` as
+    (channel, frame) rows, the frame negative for an onset in an earlier
+    block, with that peak in ``levels``; the hit count is returned. At most
+    one hit per channel carries over, so ``onsets`` needs room for
+    ``frames + channels`` rows. The lowest slow-envelope power of
+    each channel goes to ``quietest`` and the body-band filtered block to
+    ``filtered``. Nothing is allocated; the arithmetic runs in the dtype of
+    the arrays and scalars passed in.
+    """
+    frames, channels = data.shape
+    bands, sections = sos.shape[0], sos.shape[1]
+    count = 0
+    for c in range(channels):
+        quietest[c] = np.inf
+    for i in range(frames):
+        for c in range(channels):
+            fast = slow = data[i, c]  # Body band envelopes, once band 0 has run
+            start = origin + i * step
+            fused = True
+            for b in range(bands):
+                x = data[i, c]
+                for k in range(sections):
+                    y = sos[b, k, 0] * x + zi[c, b, k, 0]
+                    zi[c, b, k, 0] = sos[b, k, 1] * x - sos[b, k, 4] * y + zi[c, b, k, 1]
+                    zi[c, b, k, 1] = sos[b, k, 2] * x - sos[b, k, 5] * y
+                    x = y
+                power = x * x
+                band_fast = fast_alpha * power + envelopes[c, b, 0]
+                envelopes[c, b, 0] = fast_decay * band_fast
+                band_slow = slow_alpha * power + envelopes[c, b, 1]
+                envelopes[c, b, 1] = slow_decay * band_slow
+                if b == 0:
+                    fast = band_fast
+                    slow = band_slow
+                    filtered[i, c] = x
+                else:
+                    if band_fast > ratio * band_slow and band_fast > share * thresholds2[c]:
+                        band_onsets[c, b] = start
+                    if band_onsets[c, b] == NO_ONSET or start - band_onsets[c, b] > hold:
+                        fused = False
+            if slow < quietest[c]:
+                quietest[c] = slow
+
+            trigger = fast > thresholds2[c] and fast > ratio * slow and fused
+            onset = (trigger and not triggered[c]
+                     and (last_onset[c] == NO_ONSET or start - last_onset[c] >= refractory))
+            if open_onsets[c] != NO_ONSET and (onset or start - open_onsets[c] >= window):
+                onsets[count, 0] = c
+                onsets[count, 1] = (open_onsets[c] - origin) // step
+                levels[count] = peaks[c]
+                open_onsets[c] = NO_ONSET
+                count += 1
+            if onset:
+                last_onset[c] = start
+                open_onsets[c] = start
+                peaks[c] = fast
+            triggered[c] = trigger
+            if open_onsets[c] != NO_ONSET and fast > peaks[c]:
+                peaks[c] = fast
+    return count
+
+if njit is not None:
+    # Cached on disk next to this file, so only the very first start pays for compiling
+    detection_kernel = njit(cache=True)(detection_kernel)
+USE_NUMBA = njit is not None
+
+class OnsetDetector:
+    """Sample-level snare onset detector that keeps its state across blocks.
+
+    The power of the bandpassed signal is followed by a fast and a slow
+    envelope. A hit starts where the fast envelope is above the threshold and
+    rises clearly above the slow one. The slow envelope follows each hit's
+    decay, so the detector re-arms as soon as the drum starts to die away
+    instead of after a fixed hold-off, and several hits can land inside one
+    block. ``refractory`` only stops a single hit from retriggering. A hit's
+    level is the peak of its fast envelope over ``LEVEL_WINDOW`` from the
+    onset; the hit is reported once that has passed, so the level reads the
+    same whatever the block size, at the cost of that much latency.
+
+    With ``wire_band`` a second band follows the 2-6 kHz snare wires, and a
+    hit also needs an attack of its own there, with ``WIRE_SHARE`` of the
+    threshold power, up to ``WIRE_HOLD`` before the body band's, which toms
+    and kick bleed in the body band do not have. The wire burst is short and
+    in a roll the body's onset can come after it has died away, so the wire
+    attack is held rather than compared with the body at the same sample.
+    Both bands run through one ``FilterBank``.
+
+    With ``decimation`` > 1 the block is first downsampled by a polyphase
+    ``Decimator`` and the band filter and envelopes run at the lower rate;
+    onsets are still reported as offsets in the input block.
+
+    With ``use_numba`` (the default when numba is installed) filtering,
+    envelopes and onset logic run in the compiled ``detection_kernel``;
+    otherwise in NumPy/SciPy. Both give the same hits.
+
+    Blocks and state are kept in ``dtype`` (float32 for live audio); on the
+    numba path a steady stream of blocks allocates no arrays at all.
+
+    With ``channels`` > 1 every channel (one mic per station) is an
+    independent detector, but all of them are filtered and followed in the
+    same vectorized call.
+
+    With ``adaptive`` each channel tracks its noise floor and ``threshold``
+    only sets the minimum: the threshold used is ``noise_margin`` times the
+    floor when that is higher. The floor follows the quietest slow-envelope
+    power of every block, rising slowly (``NOISE_RISE``) and falling quickly
+    (``NOISE_FALL``). It does not rise from blocks that start within
+    ``NOISE_HOLD`` of a hit clearly above the threshold, so in a roll, however
+    long, the decay of one hit under the next is not taken for noise; the
+    next block it does rise from makes up for the time it was held. The
+    update is a couple of operations per block and channel, with no
+    history kept.
+
+    With ``reject_bleed`` hits go through a ``BleedGate`` and are reported
+    once their first ``BLEED_WINDOW`` seconds have been seen, possibly in
+    the next block (with a negative offset). ``latency`` is how many input
+    samples after its onset a hit can be reported.
+    """
+
+    def __init__(self, threshold=THRESHOLD, refractory=REFRACTORY, fs=RATE, decimation=DECIMATION,
+                 use_numba=USE_NUMBA, dtype=SAMPLE_DTYPE, channels=CHANNELS, adaptive=False,
+                 noise_margin=NOISE_MARGIN, reject_bleed=False, peak_threshold=PEAK_THRESHOLD, wire_band=False):
+        if use_numba and njit is None:
+            raise ValueError("numba is not installed")
+        self.threshold = threshold
+        self.refractory = refractory
+        self.fs = fs
+        self.use_numba = use_numba
+        self.dtype = np.dtype(dtype)
+        self.channels = channels
+        self.adaptive = adaptive
+        self.noise_margin = noise_margin
+        self.noise_hold = round(NOISE_HOLD * fs)  # In input samples, like the onsets
+        self.level_window = round(LEVEL_WINDOW * fs)
+        rate = fs / decimation
+        bands = ((LOWCUT, HIGHCUT),) + (((WIRE_LOWCUT, WIRE_HIGHCUT),) if wire_band else ())
+        top = max(highcut for _, highcut in bands)
+        if top >= (0.4 * rate if decimation > 1 else 0.5 * rate):
+            raise ValueError(f"A {rate:g} Hz detector rate leaves no room for the {top} Hz band edge")
+        self.filter = FilterBank(bands, fs=rate, dtype=dtype, channels=channels)
+        self.decimator = Decimator(decimation, fs, dtype=dtype, channels=channels) if decimation > 1 else None
+        self.gate = None
+        if reject_bleed:
+            self.gate = BleedGate(round(BLEED_WINDOW * rate), channels, peak_threshold, dtype=dtype,
+                                  decimation=decimation, delay=self.decimator.delay if self.decimator else 0.0,
+                                  lookback=math.ceil(self.level_window / decimation) + 1)
+        self.latency = ((math.ceil(self.decimator.delay) if self.decimator else 0)
+                        + max(self.level_window + decimation - 1, self.gate.span if self.gate else 0))
+        self.fast_b, self.fast_a = (c.astype(dtype) for c in envelope_coefficients(FAST_ENVELOPE, rate))
+        self.slow_b, self.slow_a = (c.astype(dtype) for c in envelope_coefficients(SLOW_ENVELOPE, rate))
+        self.onsets = np.zeros((0, 2), dtype=np.int64)
+        self.levels = np.zeros(0, dtype=dtype)
+        self.filtered = np.zeros((0, channels), dtype=dtype)
+        self.thresholds2 = np.zeros(channels, dtype=dtype)  # Power thresholds of the current block
+        self.quietest = np.zeros(channels, dtype=dtype)     # Lowest slow-envelope power of the last block
+        self.reset()
+        if use_numba:
+            self.process(np.zeros((1, channels), dtype=dtype))  # Load (or compile) the kernel now, not on the first block
+            self.reset()
+
+    def reset(self, position=0):
+        """Forget all history (e.g. when a new capture starts); the next block starts at sample ``position``."""
+        if self.decimator:
+            self.decimator.reset(position)
+        if self.gate:
+            self.gate.reset(position)
+        self.filter.reset()
+        self.fast_zi = np.zeros((len(self.filter.bands), 1, self.channels), dtype=self.dtype)
+        self.slow_zi = np.zeros((len(self.filter.bands), 1, self.channels), dtype=self.dtype)
+        self.triggered = np.zeros(self.channels, dtype=bool)  # Onset condition at the end of the last block
+        self.position = position    # Absolute sample of the next block
+        self.last_onset = np.full(self.channels, NO_ONSET)  # Absolute sample index of each channel's last hit
+        self.wire_onset = np.full((len(self.filter.bands) - 1, self.channels), NO_ONSET)  # Last wire attack sample
+        self.open_onsets = np.full(self.channels, NO_ONSET)  # Onset of each channel's hit still collecting its level
+        self.peaks = np.zeros(self.channels, dtype=self.dtype)  # Its peak fast-envelope power so far
+        self.noise_floor = None     # Per-channel noise power, once adaptive tracking has started
+        self.hold_until = np.full(self.channels, NO_ONSET)  # Sample until which the floor may not rise
+        self.unmeasured = np.zeros(self.channels)  # Seconds since the floor was last measured
+        self.noise_fall = (None, 0.0)  # Block duration and the floor's fall weight for it
+        bands, sections = self.filter.sos.shape[:2]
+        self.kernel_state = new_kernel_state(sections, self.channels, self.dtype, bands)
+
+    def effective_threshold(self, channel=0):
+        """RMS threshold the last block of ``channel`` was tested against."""
+        return float(np.sqrt(self.thresholds2[channel]))
+
+    def _update_thresholds(self):
+        self.thresholds2[:] = self.threshold ** 2
+        if self.noise_floor is not None:
+            np.maximum(self.thresholds2, self.noise_margin ** 2 * self.noise_floor, out=self.thresholds2)
+
+    def _track_noise(self, duration, start, hits):
+        self.unmeasured += duration
+        if self.noise_floor is None:
+            self.noise_floor = self.quietest.astype(np.float64)
+            self.unmeasured[:] = 0.0
+            return
+        if duration != self.noise_fall[0]:
+            self.noise_fall = (duration, 1.0 - math.exp(-duration / NOISE_FALL))
+        for channel, sample, level in hits:
+            if level * level >= NOISE_HOLD_LEVEL ** 2 * self.thresholds2[channel]:
+                self.hold_until[channel] = sample + self.noise_hold
+        # A block starting while a hit dies away is no measure of the noise; the
+        # next one that is rises by as much as the floor would have meanwhile
+        step = self.quietest - self.noise_floor
+        rising = step > 0
+        measured = self.hold_until <= start
+        measured |= ~rising
+        step *= np.where(rising, -np.expm1(self.unmeasured * (-1.0 / NOISE_RISE)), self.noise_fall[1]) * measured
+        self.noise_floor += step
+        self.unmeasured *= ~measured
+
+    def process(self, data):
+        """Filter one block and return its hits as (channel, sample offset, level).
+
+        ``data`` is (frames, channels), or 1-D for a single channel. ``level``
+        is the peak short-term RMS of the hit over ``LEVEL_WINDOW`` from its
+        onset, whatever the block size, so a hit is reported once that has
+        passed, possibly in a later block (with a negative offset). Hits are
+        in the order their windows close.
+        """
+        data = np.asarray(data, dtype=self.dtype)
+        if data.ndim == 1:
+            data = data.reshape(-1, 1)
+        if data.shape[1] != self.channels:
+            raise ValueError(f"Expected {self.channels} channel(s), got {data.shape[1]}")
+        length = len(data)
+        if self.gate:
+            self.gate.feed_broadband(data)
+        first, step, delay = 0, 1, 0
+        if self.decimator:
+            data, first = self.decimator(data)
+            step, delay = self.decimator.factor, round(self.decimator.delay)
+        hits = []
+        if len(data):
+            # Absolute input sample of data[0], undoing the anti-alias filter delay
+            origin = self.position + first - delay
+            self._update_thresholds()
+            onsets = self._run_kernel(data, origin, step) if self.use_numba else self._run_numpy(data, origin, step)
+            hits = ungated = [(channel, origin + index * step, level) for channel, index, level in onsets]
+            if self.gate:
+                hits = self.gate.judge([(channel, index, hit[1], hit) for hit, (channel, index, _) in zip(hits, onsets)])
+            if self.adaptive:
+                self._track_noise(length / self.fs, self.position, ungated)
+        hits = [(channel, sample - self.position, level) for channel, sample, level in hits]
+        self.position += length
+        return hits
+
+    def _run_kernel(self, data, origin, step):
+        if len(self.levels) < data.size + self.channels:
+            self.onsets = np.zeros((data.size + self.channels, 2), dtype=np.int64)
+            self.levels = np.zeros(data.size + self.channels, dtype=self.dtype)
+        if len(self.filtered) < len(data):
+            self.filtered = np.zeros(data.shape, dtype=self.dtype)
+        scalar = self.dtype.type
+        count = detection_kernel(data, self.filter.sos, *self.kernel_state, origin, step,
+                                 self.thresholds2, scalar(ONSET_RATIO), scalar(WIRE_SHARE), round(WIRE_HOLD * self.fs),
+                                 self.fast_b[0], -self.fast_a[1], self.slow_b[0], -self.slow_a[1],
+                                 int(self.refractory * self.fs), self.level_window, self.onsets, self.levels,
+                                 self.quietest, self.filtered)
+        if self.gate:
+            self.gate.feed(self.filtered[:len(data)])
+        return [(int(self.onsets[k, 0]), int(self.onsets[k, 1]), float(np.sqrt(self.levels[k])))
+                for k in range(count)]
+
+    def _run_numpy(self, data, origin, step):
+        # sosfilt/lfilter always allocate their outputs; square in place at least
+        power = self.filter(data)
+        if self.gate:
+            self.gate.feed(power[0])
+        np.square(power, out=power)
+        fast, self.fast_zi = lfilter(self.fast_b, self.fast_a, power, axis=1, zi=self.fast_zi)
+        slow, self.slow_zi = lfilter(self.slow_b, self.slow_a, power, axis=1, zi=self.slow_zi)
+        (fast, band_fast), (slow, band_slow) = (fast[0], fast[1:]), (slow[0], slow[1:])
+
+        np.min(slow, axis=0, out=self.quietest)
+        trigger = (fast > self.thresholds2) & (fast > ONSET_RATIO * slow)
+        if len(band_fast):
+            samples = (origin + step * np.arange(len(fast)))[:, None]
+            for other, other_slow, wire_onset in zip(band_fast, band_slow, self.wire_onset):
+                attack = np.where((other > ONSET_RATIO * other_slow) & (other > WIRE_SHARE * self.thresholds2),
+                                  samples, NO_ONSET)
+                attack[0] = np.maximum(attack[0], wire_onset)
+                np.maximum.accumulate(attack, axis=0, out=attack)
+                wire_onset[:] = attack[-1]
+                trigger &= (attack != NO_ONSET) & (samples - attack <= round(WIRE_HOLD * self.fs))
+        rising = trigger.copy()
+        rising[0] &= ~self.triggered
+        rising[1:] &= ~trigger[:-1]
+        self.triggered = trigger[-1].copy()
+
+        onsets = [[] for _ in range(self.channels)]
+        refractory = int(self.refractory * self.fs)
+        for index, channel in zip(*np.nonzero(rising)):
+            start = origin + int(index) * step
+            last = self.last_onset[channel]
+            if last != NO_ONSET and start - last < refractory:
+                continue
+            self.last_onset[channel] = start
+            onsets[channel].append(int(index))
+
+        # A hit's level is its peak over ``level_window`` from its onset (up to the channel's
+        # next hit), so one still open at the end of the block is carried over to the next
+        closed = []
+        for channel, indices in enumerate(onsets):
+            onset, peak = self.open_onsets[channel], self.peaks[channel]
+            for index, following in zip([None] + indices, indices + [len(fast)]):
+                if index is not None:
+                    onset, peak = origin + index * step, fast[index, channel]
+                if onset == NO_ONSET:
+                    continue
+                lo = 0 if index is None else index
+                end = min(max(0, -((origin - onset - self.level_window) // step)), following)
+                if end > lo:
+                    peak = max(peak, fast[lo:end, channel].max())
+                if end < len(fast):  # Closed at the end of its window or by the next hit
+                    closed.append((end, channel, int(onset - origin) // step, float(np.sqrt(peak))))
+                    onset = NO_ONSET
+            self.open_onsets[channel], self.peaks[channel] = onset, peak
+        closed.sort()  # Frame-major, like the kernel
+        return [(channel, index, level) for _, channel, index, level in closed]
+
+class SpectralFluxDetector:
+    """Onset detector that follows the rise of the short-time spectrum.
+
+    Hann-windowed frames of about ``FLUX_FRAME`` hop over the stream by a
+    quarter frame. A frame's flux is the power that appeared between
+    ``LOWCUT`` and ``WIRE_HIGHCUT`` since the previous frame, summed over the
+    bins that rose; the spectrum is scaled so that the square root of the flux
+    reads like the RMS ``threshold`` of ``OnsetDetector``. A hit starts
+    where the flux crosses the threshold.
+
+    Every frame that completes in a block is windowed into a preallocated
+    stack, transformed by a single ``rfft`` into a preallocated spectrum
+    stack and differenced against the previous frame's kept power spectrum:
+    nothing is planned or allocated per frame. The samples of the pending
+    frames live in a mirrored ring, so a block is copied in once (twice,
+    mirrored) rather than the history being shifted along every block,
+    however small the blocks get. The frames are analyzed in
+    float64 whatever ``dtype`` the blocks come in, as NumPy's FFT only has
+    float64 kernels and would otherwise cast through temporary copies. Hits
+    are reported when their frame completes, up to ``latency`` samples after
+    the onset (a negative offset in the next block). It is a drop-in for ``OnsetDetector``
+    wherever a detector is passed, e.g. ``detect_hits_detailed``.
+    """
+
+    def __init__(self, threshold=THRESHOLD, refractory=REFRACTORY, fs=RATE, dtype=SAMPLE_DTYPE,
+                 channels=CHANNELS):
+        self.threshold = threshold
+        self.refractory = refractory
+        self.fs = fs
+        self.dtype = np.dtype(dtype)
+        self.channels = channels
+        self.size = 2 ** round(math.log2(FLUX_FRAME * fs))
+        self.hop = self.size // FLUX_HOPS
+        self.latency = self.size
+        # Parseval: with the window scaled, the power spectrum (DC and Nyquist
+        # aside, both outside the band) sums to the mean square of the frame
+        window = np.hanning(self.size)
+        self.window = window * np.sqrt(2.0 / (self.size * np.sum(window ** 2)))
+        frequencies = np.fft.rfftfreq(self.size, 1 / fs)
+        self.band = slice(np.searchsorted(frequencies, LOWCUT), np.searchsorted(frequencies, WIRE_HIGHCUT, 'right'))
+        self._allocate(0)
+        self.reset()
+
+    def _allocate(self, frames):
+        """Size the per-block work stacks for blocks of ``frames`` samples."""
+        hops = frames // self.hop + 1
+        bins = self.size // 2 + 1
+        self.frames = np.zeros((hops, self.channels, self.size))
+        self.spectra = np.zeros((hops, self.channels, bins), dtype=np.complex128)
+        self.power = np.zeros((hops + 1, self.channels, bins))  # Row 0: previous frame
+        self.rises = np.zeros((hops, self.channels, bins))
+        self.flux = np.zeros((hops, self.channels))
+
+    def reset(self, position=0):
+        """Forget all history (e.g. when a new capture starts).
+
+        The next block starts at absolute sample ``position``; frames stay on
+        the grid of hops from sample 0, so a scan started part-way through a
+        recording analyzes the same frames as one from its beginning.
+        """
+        self.ring = np.zeros((self.channels, 2 * self.size))  # Mirrored history, see _write
+        self.power[0] = 0
+        self.fed = position         # Absolute sample of the next block
+        self.next_frame = -(-position // self.hop) * self.hop  # Absolute sample the next frame starts at
+        self.position = position
+        self.triggered = np.zeros(self.channels, dtype=bool)
+        self.last_onset = np.full(self.channels, NO_ONSET)
+
+    def effective_threshold(self, channel=0):
+        return float(self.threshold)
+
+    def _write(self, samples, start):
+        """Store (channels, n) ``samples`` starting at absolute sample ``start`` in the ring.
+
+        Each sample is written twice, half the ring apart, so that any window
+        of up to half the ring is one contiguous slice (``_window``).
+        """
+        capacity = self.ring.shape[1] // 2
+        column = start % capacity
+        split = min(samples.shape[1], capacity - column)
+        for mirror in (0, capacity):
+            self.ring[:, mirror + column:mirror + column + split] = samples[:, :split]
+            self.ring[:, mirror:mirror + samples.shape[1] - split] = samples[:, split:]
+
+    def _window(self, start, length):
+        """View of the ``length`` samples from absolute sample ``start`` on."""
+        column = start % (self.ring.shape[1] // 2)
+        return self.ring[:, column:column + length]
+
+    def process(self, data):
+        """Analyze one block and return its hits as (channel, sample offset, level).
+
+        Same contract as ``OnsetDetector.process``; ``level`` is the square
+        root of the hit's peak flux.
+        """
+        data = np.asarray(data, dtype=self.dtype)
+        if data.ndim == 1:
+            data = data.reshape(-1, 1)
+        if data.shape[1] != self.channels:
+            raise ValueError(f"Expected {self.channels} channel(s), got {data.shape[1]}")
+        length = len(data)
+        if self.ring.shape[1] != 2 * (self.size + length):
+            # Room for the partial frame still pending plus a block
+            history = self._window(self.fed - self.size + 1, self.size - 1).copy()
+            self.ring = np.zeros((self.channels, 2 * (self.size + length)))
+            self._write(history, self.fed - self.size + 1)
+            previous = self.power[0].copy()
+            self._allocate(length)
+            self.power[0] = previous
+        self._write(data.T, self.fed)
+        self.fed += length
+
+        hits = []
+        hops = max(0, (self.fed - self.size - self.next_frame) // self.hop + 1)
+        if hops:
+            frames = self.frames[:hops]
+            for index in range(hops):
+                # Frame by frame: a strided multiply over all windows buffers a copy
+                np.multiply(self._window(self.next_frame + index * self.hop, self.size), self.window,
+                            out=frames[index])
+            spectra = np.fft.rfft(frames, axis=-1, out=self.spectra[:hops])
+            power = self.power[1:hops + 1]
+            np.abs(spectra, out=power)
+            np.square(power, out=power)
+            rises = np.subtract(power, self.power[:hops], out=self.rises[:hops])
+            np.maximum(rises, 0, out=rises)
+            flux = np.sum(rises[:, :, self.band], axis=2, out=self.flux[:hops])
+            self.power[0] = self.power[hops]
+            hits = self._pick_onsets(flux, self.next_frame)
+            self.next_frame += hops * self.hop
+        hits = [(channel, sample - self.position, level) for channel, sample, level in hits]
+        self.position += length
+        return hits
+
+    def _pick_onsets(self, flux, start):
+        trigger = flux > self.threshold ** 2
+        rising = trigger.copy()
+        rising[0] &= ~self.triggered
+        rising[1:] &= ~trigger[:-1]
+        self.triggered = trigger[-1].copy()
+
+        onsets = []
+        refractory = int(self.refractory * self.fs)
+        for index, channel in zip(*np.nonzero(rising)):
+            # The flux jumps once the attack reaches the middle of the window
+            sample = start + int(index) * self.hop + self.size // 2
+            last = self.last_onset[channel]
+            if last != NO_ONSET and sample - last < refractory:
+                continue
+            self.last_onset[channel] = sample
+            onsets.append((int(channel), int(index), sample))
+
+        hits = []
+        end = np.full(self.channels, len(flux))
+        for channel, index, sample in reversed(onsets):
+            hits.append((channel, sample, float(np.sqrt(flux[index:end[channel], channel].max()))))
+            end[channel] = index
+        return hits[::-1]
+
+def create_detector(threshold=THRESHOLD, refractory=REFRACTORY, fs=RATE, method="rms", **options):
+    """Build the detector selected by ``method``: "rms" (``OnsetDetector``) or "flux"."""
+    if method == "flux":
+        unsupported = [name for name in ("decimation", "adaptive", "reject_bleed", "wire_band")
+                       if options.pop(name, None) not in (None, False, 1)]
+        if unsupported:
+            raise ValueError(f"The spectral-flux detector does not support {', '.join(unsupported)}")
+        for name in ("use_numba", "noise_margin", "peak_threshold"):
+            options.pop(name, None)
+        return SpectralFluxDetector(threshold, refractory, fs, **options)
+    return OnsetDetector(threshold, refractory, fs, **options)
+
+def onset_delay(detector, level=ONSET_PROBE_LEVEL):
+    """Seconds by which ``detector`` stamps a hit's onset after its attack.
+
+    The band filter and the envelopes' rise to the threshold delay the
+    stamp, the more so the quieter the hit. A reference snare hit, ``level``
+    times the threshold, is played into the first channel of ``detector``,
+    which is then reset.
+    """
+    rng = np.random.default_rng(0)
+    attack = round(0.1 * detector.fs)
+    t = np.arange(round(0.2 * detector.fs)) / detector.fs
+    probe = np.zeros((attack + t.size, detector.channels), dtype=np.float32)
+    probe[attack:, 0] = level * detector.threshold * np.sqrt(2) * (
+        np.sin(2 * np.pi * np.sqrt(LOWCUT * HIGHCUT) * t) * np.exp(-t / 0.05)
+        + 0.5 * rng.normal(size=t.size) * np.exp(-t / 0.01))
+    hits = detector.process(probe)
+    detector.reset()
+    return max(0.0, (hits[0][1] - attack) / detector.fs) if hits else 0.0
+
+onset_detector = OnsetDetector()
+
+def detect_hits_detailed(indata, threshold=THRESHOLD, adc_time=None, detector=None, clock=None, hit_counts=None):
+    """Detect snare hits with bandpass filtering and return detailed info for each.
+
+    ``adc_time`` is the stream time of the block's first sample; each hit is
+    stamped with the time of its onset sample, converted to wall-clock time
+    with ``clock``, and tagged with the channel it was played on. Its
+    ``threshold`` is the one it was detected against, which an adaptive
+    detector raises above ``threshold`` in a noisy room. ``hit_counts``
+    holds the running hit count of every channel, which numbers the hits;
+    without it they are numbered within the block.
+    """
+    detector = detector or onset_detector
+    hit_counts = [0] * detector.channels if hit_counts is None else hit_counts
+    clock = clock or stream_clock
+
+    # Use the detector's channels, the first one if it has just one
+    channel_data = indata[:, :detector.channels] if indata.ndim > 1 else indata
+
+    if adc_time is None:
+        adc_time = time.monotonic() - len(channel_data) / detector.fs
+
+    detector.threshold = threshold
+    hits = []
+    for channel, offset, level in detector.process(channel_data):
+        hit_counts[channel] += 1
+        stream_time = adc_time + offset / detector.fs
+        hits.append({
             "type": "hit",
-            "timestamp": now,
-            "hit_number": hit_count,
-            "rms_value": float(rms),
-            "threshold": float(threshold)
-        }
-    return None
+            "timestamp": clock.to_wall(stream_time),
+            "stream_time": stream_time,
+            "channel": channel,
+            "hit_number": hit_counts[channel],
+            "rms_value": level,
+            "threshold": detector.effective_threshold(channel)
+        })
+    return hits
 
 # =========================
 # Audio Devices
@@ -106,16 +1017,105 @@ def list_devices():
             print(f"      Channels: {device['max_input_channels']}, Sample Rate: {device['default_samplerate']} Hz")
     print()
 
+class AudioInput:
+    """One capture device with its own ring, clock and detector bank.
+
+    Each device runs on its own ADC clock, so its blocks are never aligned
+    with another device's: every device gets its own ``BlockRing``,
+    ``StreamClock`` and ``OnsetDetector``, while the process, the compiled
+    kernel and the event loop are shared. Its channels are numbered as
+    stations from ``first_station`` on.
+
+    ``hit_counts`` numbers the hits of each of its stations since the last
+    ``reset``.
+
+    With ``blocksize`` (low-latency mode) the stream delivers blocks of that
+    many frames with PortAudio's low latency setting instead of 50 ms
+    blocks; the ring holds as many more of them, and the detector, which
+    keeps its own history, just sees shorter blocks.
+    """
+
+    def __init__(self, device_index, detector, first_station=0, blocksize=None):
+        self.device = device_index
+        self.detector = detector
+        self.first_station = first_station
+        self.low_latency = blocksize is not None
+        self.blocksize = blocksize or int(RATE * BLOCK_DURATION)
+        capacity = max(RING_CAPACITY, round(RING_CAPACITY * RATE * BLOCK_DURATION / self.blocksize))
+        self.ring = BlockRing(capacity, self.blocksize, detector.channels)
+        self.hit_counts = [0] * detector.channels
+        self.clock = StreamClock()
+        self.overruns = 0
+
+    @property
+    def stations(self):
+        return range(self.first_station, self.first_station + self.detector.channels)
+
+    def open_stream(self):
+        """Open (without starting) the input stream feeding this device's ring."""
+        return sd.InputStream(device=self.device,
+                              channels=self.detector.channels,
+                              samplerate=RATE,
+                              callback=self.callback,
+                              blocksize=self.blocksize,
+                              latency='low' if self.low_latency else None)
+
+    def callback(self, indata, frames, time_info, status):
+        """Collect audio blocks, with the ADC time of their first sample, into the ring."""
+        if status:
+            print(status)
+        self.ring.push(indata, block_adc_time(frames, time_info, self.clock))
+
+    def reset(self):
+        """Start detection and hit numbering afresh (e.g. when capture resumes)."""
+        self.detector.reset()
+        self.hit_counts = [0] * self.detector.channels
+
+    def report_overruns(self):
+        """Warn when the ring dropped blocks since the last check."""
+        if self.ring.overruns != self.overruns:
+            print(f"⚠️  Detection fell behind on device {self.device}, "
+                  f"dropped {self.ring.overruns - self.overruns} audio block(s)")
+            self.overruns = self.ring.overruns
+
+    def detect(self, indata, threshold, adc_time):
+        """Detect the hits of one block, tagged with their device and station."""
+        hits = detect_hits_detailed(indata, threshold=threshold, adc_time=adc_time,
+                                    detector=self.detector, clock=self.clock, hit_counts=self.hit_counts)
+        for hit_data in hits:
+            hit_data["device"] = self.device
+            hit_data["station"] = self.first_station + hit_data["channel"]
+        return hits
+
+def open_inputs(devices, threshold, refractory=REFRACTORY, detector_options=None, blocksize=None):
+    """Create an ``AudioInput`` per device, numbering stations across all of them."""
+    inputs = []
+    first_station = 0
+    for device_index in devices:
+        detector = create_detector(threshold, refractory, **(detector_options or {}))
+        inputs.append(AudioInput(device_index, detector, first_station, blocksize))
+        first_station += detector.channels
+    return inputs
+
+def print_low_latency(audio_input):
+    """Describe the delays low-latency mode is made of, ahead of any measurement."""
+    block_ms = audio_input.blocksize / RATE * 1000
+    report_ms = audio_input.detector.latency / RATE * 1000
+    print(f"⚡ Low latency: {audio_input.blocksize}-frame blocks ({block_ms:.1f} ms), "
+          f"onsets stamped ~{onset_delay(audio_input.detector) * 1000:.1f} ms after the attack "
+          f"and reported up to {report_ms:.1f} ms after that")
+
 # =========================
 # Snare Counter
 # =========================
-def run_snare_counter(duration, device_index=None, threshold=None, verbose=False):
+def run_snare_counter(duration, device_index=None, threshold=None, verbose=False, refractory=REFRACTORY,
+                      detector_options=None, blocksize=None):
     """Run the snare drum hit counter."""
-    global hit_count
-    hit_count = 0
-    
     if threshold is None:
         threshold = THRESHOLD
+    audio_input, = open_inputs([device_index], threshold, refractory, detector_options, blocksize)
+    channels = audio_input.detector.channels
+    station_hits = audio_input.hit_counts
     
     if device_index is not None:
         print(f"\n🎧 Using input device {device_index}")
@@ -124,56 +1124,921 @@ def run_snare_counter(duration, device_index=None, threshold=None, verbose=False
     
     if verbose:
         print(f"📊 Threshold: {threshold}")
+        if blocksize:
+            print_low_latency(audio_input)
     
     print(f"⏱  Listening for {duration} seconds... Hit the snare!\n")
     
-    with sd.InputStream(device=device_index,
-                        channels=CHANNELS,
-                        samplerate=RATE,
-                        callback=audio_callback,
-                        blocksize=int(RATE * BLOCK_DURATION)):
+    with audio_input.open_stream():
+        ring = audio_input.ring
+        indata = np.empty_like(ring.blocks[0])
         start_time = time.time()
         while time.time() - start_time < duration:
-            indata = q.get()
-            if detect_hits(indata, threshold=threshold):
-                hit_count += 1
-                print(f"Snare Hits: {hit_count}")
+            adc_time = ring.get(indata)
+            audio_input.report_overruns()
+            hits = audio_input.detect(indata, threshold, adc_time)
+            if hits and channels > 1:
+                print("Snare Hits: " + ", ".join(f"ch{c} {n}" for c, n in enumerate(station_hits)))
+            elif hits:
+                print(f"Snare Hits: {station_hits[0]}")
+
+    print(f"\n✅ Total snare hits in {duration} seconds: {sum(station_hits)}\n")
+    if channels > 1:
+        for channel, count in enumerate(station_hits):
+            print(f"   Channel {channel}: {count}")
+        print()
+
+# =========================
+# Offline File Analysis
+# =========================
+def scan_recording(audio, threshold=THRESHOLD, refractory=REFRACTORY, start=0, stop=None, warmup=0,
+                   detector_options=None):
+    """Yield the hits found in frames [start, stop) of an open SoundFile.
+
+    The file is read one block at a time into a reused buffer and every block
+    goes through ``detect_hits_detailed`` exactly like live audio. Blocks sit
+    on the same grid as a pass from the beginning of the file. Detection
+    starts ``warmup`` frames before ``start`` so the filter and refractory
+    state have settled by then; hits found in the warm-up are dropped. The
+    detector is told where it starts, so its frame grid is the single
+    pass's.
+    ``detector_options`` are extra ``create_detector`` arguments.
+
+    Offline analysis is not real-time bound and runs in ``ANALYSIS_DTYPE``
+    (float64): float32 rounding in the filter state never settles to the
+    same bits after a warm-up, and sharded results must match a single pass.
+    """
+    fs = audio.samplerate
+    blocksize = int(fs * BLOCK_DURATION)
+    detector = create_detector(threshold, refractory, fs=fs, dtype=ANALYSIS_DTYPE, **(detector_options or {}))
+    if detector.channels > audio.channels:
+        raise ValueError(f"{detector.channels} channels requested, the file has {audio.channels}")
+    buffer = np.empty((blocksize, audio.channels), dtype=ANALYSIS_DTYPE)
+    stop = audio.frames if stop is None else min(stop, audio.frames)
+
+    # Hits can be reported up to detector.latency samples after their onset
+    end = min(stop + detector.latency, audio.frames)
+    position = max(0, start - warmup) // blocksize * blocksize
+    detector.reset(position)  # Frame grids as in a pass from the beginning of the file
+    audio.seek(position)
+    while position < end:
+        indata = audio.read(out=buffer)
+        if len(indata) == 0:
+            break
+        for hit_data in detect_hits_detailed(indata, threshold=threshold, adc_time=position / fs, detector=detector):
+            sample = round(hit_data["stream_time"] * fs)
+            if start <= sample < stop:
+                yield {
+                    "sample": sample,
+                    "time": round(sample / fs, 6),
+                    "channel": hit_data["channel"],
+                    "rms_value": hit_data["rms_value"],
+                }
+        position += len(indata)
+
+def summarize_file(path, fs, duration, hits, elapsed, quiet=False):
+    """Number the hits of a file, report totals and return the summary dict."""
+    for number, hit in enumerate(hits, 1):
+        hit["hit_number"] = number
+    realtime_factor = duration / elapsed if elapsed > 0 else float('inf')
+    if not quiet:
+        print(f"\n✅ Total snare hits in {duration:.1f} seconds of audio: {len(hits)}")
+        print(f"⚡ Processed in {elapsed:.2f} s ({realtime_factor:.1f}x real time)\n")
+    return {
+        "file": str(path),
+        "samplerate": fs,
+        "duration": duration,
+        "hit_count": len(hits),
+        "hits": hits,
+        "processing_time": elapsed,
+        "realtime_factor": realtime_factor,
+    }
+
+def analyze_file(path, threshold=THRESHOLD, refractory=REFRACTORY, verbose=False, quiet=False,
+                 detector_options=None):
+    """Stream a recorded session (WAV/FLAC/...) through the detector.
+
+    Hit times are seconds from the start of the file. Returns a summary dict;
+    ``quiet`` suppresses all printing.
+    """
+    with sf.SoundFile(path) as audio:
+        duration = audio.frames / audio.samplerate
+        if not quiet:
+            print(f"\n📂 Analyzing {path} ({audio.samplerate} Hz, {audio.channels} ch, {duration:.1f} s)")
+        if verbose and not quiet:
+            print(f"📊 Threshold: {threshold}")
+
+        hits = []
+        start = time.perf_counter()
+        for hit in scan_recording(audio, threshold, refractory, detector_options=detector_options):
+            hits.append(hit)
+            if not quiet:
+                print(f"🥁 Hit #{len(hits)} at {hit['time']:.3f} s on channel {hit['channel']} "
+                      f"(RMS: {hit['rms_value']:.3f})")
+        elapsed = time.perf_counter() - start
+
+    return summarize_file(path, audio.samplerate, duration, hits, elapsed, quiet)
+
+def analyze_shard(path, start, stop, threshold, refractory, detector_options):
+    """Process pool worker: hits of frames [start, stop) of one file."""
+    warmup = SHARD_WARMUP
+    if (detector_options or {}).get("adaptive"):
+        warmup += 5 * NOISE_RISE  # Long enough for the noise floor to forget where the warm-up began
+    with sf.SoundFile(path) as audio:
+        warmup = int(warmup * audio.samplerate)
+        return list(scan_recording(audio, threshold, refractory, start, stop, warmup, detector_options))
+
+def analyze_file_sharded(path, shards, jobs=None, threshold=THRESHOLD, refractory=REFRACTORY, verbose=False,
+                         detector_options=None):
+    """Analyze one long recording as time shards spread over several processes.
+
+    Each shard seeks to its own slice of the file and warms up on the audio
+    before it, so it reaches its first frame in the same state as a single
+    pass would. Shard boundaries fall on the block grid, and a hit found by a
+    shard within the refractory window of the previous shard's last hit on
+    the same channel is dropped, so the merged hits match a single-threaded
+    pass.
+    """
+    with sf.SoundFile(path) as audio:
+        fs, frames, channels = audio.samplerate, audio.frames, audio.channels
+    duration = frames / fs
+    blocks = -(-frames // int(fs * BLOCK_DURATION))
+    bounds = [min(frames, blocks * i // shards * int(fs * BLOCK_DURATION)) for i in range(shards + 1)]
+    bounds[-1] = frames
+    print(f"\n📂 Analyzing {path} ({fs} Hz, {channels} ch, {duration:.1f} s) in {shards} shards")
+    if verbose:
+        print(f"📊 Threshold: {threshold}")
 
-    print(f"\n✅ Total snare hits in {duration} seconds: {hit_count}\n")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = pool.map(analyze_shard, [path] * shards, bounds[:-1], bounds[1:],
+                           [threshold] * shards, [refractory] * shards, [detector_options] * shards)
+        hits = []
+        last_hits = {}  # Channel -> sample of its last merged hit
+        for shard_hits in results:
+            for hit in shard_hits:
+                last = last_hits.get(hit["channel"])
+                if last is not None and hit["sample"] - last < int(refractory * fs):
+                    continue  # Same hit seen from both sides of a boundary
+                last_hits[hit["channel"]] = hit["sample"]
+                hits.append(hit)
+    elapsed = time.perf_counter() - start
+
+    for number, hit in enumerate(hits, 1):
+        print(f"🥁 Hit #{number} at {hit['time']:.3f} s on channel {hit['channel']} (RMS: {hit['rms_value']:.3f})")
+    return summarize_file(path, fs, duration, hits, elapsed)
+
+def find_recordings(pattern):
+    """Expand a directory (searched recursively) or glob into audio file paths."""
+    if os.path.isdir(pattern):
+        extensions = {f".{fmt.lower()}" for fmt in sf.available_formats()}
+        paths = [p for p in Path(pattern).rglob('*') if p.suffix.lower() in extensions]
+    else:
+        paths = [Path(p) for p in glob.glob(pattern, recursive=True)]
+    return sorted(str(p) for p in paths if p.is_file())
+
+def load_finished(output):
+    """Return the files already analyzed successfully in a results file."""
+    finished = set()
+    if os.path.exists(output):
+        with open(output) as results:
+            for line in results:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Partial line from an interrupted run
+                if "error" not in record:
+                    finished.add(record["file"])
+    return finished
+
+def analyze_file_quietly(path, threshold, refractory, detector_options):
+    """Process pool worker: analyze one file, reporting failures as a record."""
+    try:
+        return analyze_file(path, threshold=threshold, refractory=refractory, quiet=True,
+                            detector_options=detector_options)
+    except Exception as e:
+        return {"file": path, "error": str(e)}
+
+def run_batch(pattern, output, jobs=None, threshold=THRESHOLD, refractory=REFRACTORY, detector_options=None):
+    """Re-score many recordings in parallel, appending one JSON line per file.
+
+    Each worker process runs its own detector. Results are written as soon as
+    a file finishes, and files already in ``output`` are skipped, so an
+    interrupted batch can simply be run again.
+    """
+    paths = find_recordings(pattern)
+    finished = load_finished(output)
+    pending = [p for p in paths if p not in finished]
+    jobs = jobs or os.cpu_count()
+    print(f"\n📂 {len(paths)} recordings found, {len(paths) - len(pending)} already in {output}")
+    if not pending:
+        return
+
+    print(f"⚙️  Analyzing {len(pending)} files with {jobs} worker(s)...\n")
+    total_audio = 0.0
+    failures = 0
+    start = time.perf_counter()
+    with open(output, 'a') as results, ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(analyze_file_quietly, p, threshold, refractory, detector_options)
+                   for p in pending]
+        for done, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            results.write(json.dumps(record) + "\n")
+            results.flush()
+            if "error" in record:
+                failures += 1
+                print(f"[{done}/{len(pending)}] ❌ {record['file']}: {record['error']}")
+            else:
+                total_audio += record["duration"]
+                print(f"[{done}/{len(pending)}] 🥁 {record['file']}: {record['hit_count']} hits")
+    elapsed = time.perf_counter() - start
+
+    print(f"\n✅ {len(pending) - failures} files analyzed, {failures} failed")
+    print(f"⚡ {total_audio:.1f} s of audio in {elapsed:.2f} s ({total_audio / elapsed:.1f}x real time)\n")
 
 # =========================
 # WebSocket Server
 # =========================
-connected_clients: Set = set()  # Set of websocket connections
-websocket_running = False
-hit_queue = asyncio.Queue()  # Async queue for hit events
+connected_clients: Set = set()  # Set of websocket connections; detection runs while there are any
+
+class LatencyMeter:
+    """End-to-end latency of the hits delivered to clients.
+
+    A delivery's latency runs from the hit's attack to the moment the message
+    was handed to the client's socket: the detector's ``onset_delay`` (the
+    attack to the onset sample it stamps), then from the ADC time of that
+    sample (the hit's wall-clock ``timestamp``) block buffering, detection,
+    queueing and sending. The last ``window`` deliveries are kept in a
+    preallocated ring.
+    """
+
+    def __init__(self, window=LATENCY_WINDOW, onset_delay=0.0):
+        self.latencies = np.zeros(window)
+        self.count = 0
+        self.onset_delay = onset_delay
+
+    def reset(self):
+        self.count = 0
+
+    def record(self, timestamp: float):
+        """A hit with onset at wall-clock ``timestamp`` was just sent."""
+        self.latencies[self.count % len(self.latencies)] = time.time() - timestamp + self.onset_delay
+        self.count += 1
+
+    def summary(self) -> Optional[Dict[str, float]]:
+        """Median, 95th percentile and worst latency (s) of the recent deliveries."""
+        if not self.count:
+            return None
+        recent = self.latencies[:min(self.count, len(self.latencies))]
+        median, p95 = np.percentile(recent, (50, 95))
+        return {"deliveries": len(recent), "median": median, "p95": p95, "max": recent.max()}
+
+    def report(self):
+        """Print the summary against ``LATENCY_TARGET``."""
+        summary = self.summary()
+        if summary is None:
+            return
+        marker = "✅" if summary["p95"] < LATENCY_TARGET else "⚠️ "
+        print(f"{marker} Attack→send latency over {summary['deliveries']} deliveries: "
+              f"median {summary['median'] * 1000:.1f} ms, p95 {summary['p95'] * 1000:.1f} ms, "
+              f"max {summary['max'] * 1000:.1f} ms, {self.onset_delay * 1000:.1f} ms of it before the onset stamp "
+              f"(target {LATENCY_TARGET * 1000:.0f} ms)")
+
+latency_meter = LatencyMeter()
+
+def select_subprotocol(connection, subprotocols):
+    """Negotiate the binary hit records when offered; other clients get JSON."""
+    return BINARY_SUBPROTOCOL if BINARY_SUBPROTOCOL in subprotocols else None
+
+def encode_event(event: Dict[str, Any], binary: bool = False):
+    """Serialize an event for a JSON client, or for a binary one (hits only, as a ``HIT_RECORD``).
+
+    Binary clients get every other event as JSON in a text frame.
+    """
+    if binary and event.get("type") == "hit":
+        device = event.get("device")
+        return HIT_RECORD.pack(RECORD_HIT, event.get("station", event["channel"]), event["channel"],
+                               -1 if device is None else device, event["hit_number"], event.get("seq", 0),
+                               event["timestamp"], event["stream_time"], event["rms_value"], event["threshold"])
+    return json.dumps(event)
+
+def join_messages(messages: List[Any]):
+    """Join encoded events into one message: a ``batch``, or one frame of binary records."""
+    if isinstance(messages[0], bytes):
+        return b"".join(messages)
+    return '{"type": "batch", "events": [' + ", ".join(messages) + ']}'
+
+class ClientOutbox:
+    """Bounded queue of the messages waiting to be sent to one client.
+
+    Publishing never waits on a client: when a client cannot keep up, its
+    outbox fills up and its ``policy`` applies, to that client alone:
+
+    * ``drop-oldest``: the oldest queued message makes room for the new one.
+    * ``coalesce``: whatever is queued goes out as one ``batch`` message
+      (``{"type": "batch", "events": [...]}``, or for a ``binary`` client
+      one frame of consecutive hit records), so a client that is slow per
+      message catches up; a full outbox still drops its oldest message.
+    * ``disconnect``: once the outbox is full or its oldest undelivered
+      message is ``max_lag`` seconds old, the outbox closes and calls
+      ``on_close``, which disconnects the client even while a send to it
+      is stuck.
+
+    Items are (message, onset timestamp) pairs, the timestamp only set for
+    hits so the sender can measure their latency. ``stats`` reports how far
+    behind the client is (``lag``: age of its oldest undelivered message)
+    and what was dropped.
+    """
+
+    def __init__(self, capacity=OUTBOX_CAPACITY, policy="drop-oldest", max_lag=MAX_LAG, on_close=None,
+                 binary=False):
+        if policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"Unknown slow-client policy {policy!r}")
+        self.binary = binary
+        self.capacity = capacity
+        self.policy = policy
+        self.max_lag = max_lag
+        self.on_close = on_close
+        self.items = deque()        # (message, onset, queued_at)
+        self.sending_since = None   # Queue time of the message being sent
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0          # Messages sent inside a batch
+        self.max_lag_seen = 0.0
+        self._ready = asyncio.Event()
+
+    @property
+    def lag(self) -> float:
+        """Age (s) of the oldest message not delivered yet."""
+        oldest = self.sending_since if self.sending_since is not None else (
+            self.items[0][2] if self.items else None)
+        return 0.0 if oldest is None else time.monotonic() - oldest
+
+    def put_nowait(self, item):
+        """Queue an item, applying the slow-client policy; never blocks."""
+        if self.closed:
+            return
+        if self.policy == "disconnect" and (len(self.items) >= self.capacity or self.lag > self.max_lag):
+            self.close()
+            return
+        if len(self.items) >= self.capacity:
+            self.items.popleft()
+            self.dropped += 1
+        message, onset = item
+        self.items.append((message, onset, time.monotonic()))
+        self._ready.set()
+
+    def close(self):
+        """Stop queueing and wake the sender, whose ``get`` then returns None."""
+        self.closed = True
+        self.max_lag_seen = max(self.max_lag_seen, self.lag)
+        if self.on_close is not None:
+            self.on_close()
+        self.items.clear()
+        self._ready.set()
+
+    async def get(self):
+        """Wait for the next (message, onset) to send; None once closed."""
+        while not self.items and not self.closed:
+            self._ready.clear()
+            await self._ready.wait()
+        if self.closed:
+            return None
+        if self.policy == "coalesce" and len(self.items) > 1:
+            # Batch the leading run of JSON messages, or of binary records
+            kind = type(self.items[0][0])
+            batch = []
+            while self.items and type(self.items[0][0]) is kind:
+                batch.append(self.items.popleft())
+            self.sending_since = batch[0][2]
+            onsets = [onset for _, onset, _ in batch if onset is not None]
+            onset = min(onsets) if onsets else None
+            if len(batch) == 1:
+                return batch[0][0], onset
+            self.coalesced += len(batch)
+            return join_messages([message for message, _, _ in batch]), onset
+        message, onset, self.sending_since = self.items.popleft()
+        return message, onset
+
+    def delivered(self):
+        """The message from the last ``get`` was sent."""
+        self.max_lag_seen = max(self.max_lag_seen, self.lag)
+        self.sending_since = None
+        self.sent += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"policy": self.policy, "closed": self.closed, "queued": len(self.items),
+                "sent": self.sent, "dropped": self.dropped, "coalesced": self.coalesced,
+                "lag_ms": self.lag * 1000, "max_lag_ms": max(self.max_lag_seen, self.lag) * 1000}
+
+class HitBroadcaster:
+    """Publish/subscribe hub that fans events out to clients.
+
+    Each subscriber gets its own bounded ``ClientOutbox``, created with the
+    broadcaster's capacity, slow-client policy and lag limit, and each event
+    is serialized once per protocol in use (JSON, binary records) no matter
+    how many clients are connected. A subscriber either gets every
+    event or only those of the stations it asked for; events are routed by
+    their ``station`` with one dictionary lookup.
+
+    Every event is numbered with a ``seq`` that increases by one per event
+    published, and the last ``history`` events are kept, so a client that
+    lost its connection can reconnect with the last ``seq`` it got and be
+    sent exactly the events it missed. Numbers restart with the server,
+    which is why clients also get its ``epoch``.
+    """
+
+    def __init__(self, capacity=OUTBOX_CAPACITY, policy="drop-oldest", max_lag=MAX_LAG,
+                 history=REPLAY_CAPACITY):
+        self.capacity = capacity
+        self.policy = policy
+        self.max_lag = max_lag
+        self.subscribers: Set[ClientOutbox] = set()  # Subscribed to every station
+        self.station_subscribers: Dict[int, Set[ClientOutbox]] = {}
+        self.epoch = os.urandom(4).hex()  # Tells this run's sequence numbers from a previous one's
+        self.seq = 0  # Number of the last event published
+        self.history = deque(maxlen=history)  # (seq, station, event) of the recent events
+
+    def subscribe(self, stations: Optional[Set[int]] = None, on_close=None, binary=False) -> ClientOutbox:
+        """Register a new subscriber; it only receives events published from now on.
+
+        With ``stations``, events of other stations are not queued for it.
+        ``on_close`` is called if its outbox gives up on it. ``binary``
+        subscribers get hits as ``HIT_RECORD``s.
+        """
+        queue = ClientOutbox(self.capacity, self.policy, self.max_lag, on_close, binary)
+        if stations is None:
+            self.subscribers.add(queue)
+        else:
+            for station in stations:
+                self.station_subscribers.setdefault(station, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, queue: ClientOutbox):
+        self.subscribers.discard(queue)
+        for station, queues in list(self.station_subscribers.items()):
+            queues.discard(queue)
+            if not queues:
+                del self.station_subscribers[station]
+
+    def replay(self, queue: ClientOutbox, stations: Optional[Set[int]], last_seq: int) -> int:
+        """Queue for ``queue`` the events of ``stations`` published after ``last_seq``.
+
+        Call it right after ``subscribe``, before anything else is published,
+        so no event is missed or sent twice. The events go out joined into
+        as few messages as possible, without counting against the outbox
+        capacity one by one. Returns how many events after ``last_seq`` are
+        no longer kept (of any station), 0 when the replay is complete.
+        """
+        missed = [event for seq, station, event in self.history
+                  if seq > last_seq and (stations is None or station in stations)]
+        # Runs of binary records and of JSON events, each joined into one message
+        for _, run in groupby(missed, key=lambda event: queue.binary and event.get("type") == "hit"):
+            messages = [encode_event(event, queue.binary) for event in run]
+            queue.put_nowait((join_messages(messages) if len(messages) > 1 else messages[0], None))
+        oldest = self.history[0][0] if self.history else self.seq + 1
+        return max(0, oldest - last_seq - 1)
+
+    def publish(self, event: Dict[str, Any]):
+        """Number ``event``, serialize it and queue it for every subscriber of its station."""
+        self.seq += 1
+        event["seq"] = self.seq
+        self.history.append((self.seq, event.get("station"), event))
+        onset = event.get("timestamp") if event.get("type") == "hit" else None
+        items = {}  # Encoded once per protocol
+        for queue in chain(self.subscribers, self.station_subscribers.get(event.get("station"), ())):
+            item = items.get(queue.binary)
+            if item is None:
+                item = items[queue.binary] = (encode_event(event, queue.binary), onset)
+            queue.put_nowait(item)
+
+broadcaster = HitBroadcaster()
+
+class AudioCapture:
+    """Run the input streams only while WebSocket clients are connected.
+
+    The streams are opened once and then only started and stopped, which is
+    much quicker than reopening the devices, so a player's first hit is not
+    lost. After the last client leaves, they keep running for a grace period
+    in case a display is just reconnecting.
+    """
+
+    def __init__(self, streams, grace=IDLE_GRACE):
+        self.streams = streams
+        self.grace = grace
+        self._stop_handle: Optional[asyncio.TimerHandle] = None
+
+    def acquire(self) -> bool:
+        """A client subscribed: make sure the streams are running.
+
+        Returns True if they had stopped, False if they were still running
+        (e.g. a client reconnecting within the grace period).
+        """
+        if self._stop_handle is not None:
+            self._stop_handle.cancel()
+            self._stop_handle = None
+        if all(stream.active for stream in self.streams):
+            return False
+        for stream in self.streams:
+            if not stream.active:
+                stream.start()
+        print("🎤 Audio capture started")
+        return True
+
+    def release(self):
+        """The last client left: stop the stream once the grace period expires."""
+        if self._stop_handle is None:
+            self._stop_handle = asyncio.get_running_loop().call_later(self.grace, self._stop)
+
+    def _stop(self):
+        self._stop_handle = None
+        if any(stream.active for stream in self.streams):
+            for stream in self.streams:
+                if stream.active:
+                    stream.abort()
+            print("💤 Audio capture stopped")
+
+audio_capture: Optional[AudioCapture] = None
+audio_inputs: List[AudioInput] = []
+
+class GameSession:
+    """A timed game scored by the detector rather than by the browser.
+
+    The window [``start``, ``end``) is kept on the monotonic clock, and a
+    hit counts when its onset, mapped from its device's stream time onto
+    the same clock, falls inside it on one of ``stations`` (None: all). The
+    score is settled ``settle`` seconds after the window closes, once hits
+    played just before the end have made it through detection, so browser
+    timer jitter or a throttled tab has no say in it.
+
+    Every session keeps its own counts, and with ``refractory`` its own
+    minimum gap between two counted hits of a station on top of the
+    detector's, so e.g. a ranked game can be stricter than a practice
+    screen scoring the same drum. Its ``id`` lets a client that lost its
+    connection resume it.
+    """
+
+    def __init__(self, duration: float, stations: Optional[Set[int]] = None, delay: float = 0.0,
+                 settle: float = SESSION_SETTLE, refractory: float = 0.0):
+        self.id = os.urandom(4).hex()
+        self.duration = duration
+        self.stations = stations
+        self.settle = settle
+        self.refractory = refractory
+        self.last_hit: Dict[int, float] = {}  # Onset of each station's last counted hit
+        self.start = time.monotonic() + delay
+        self.end = self.start + duration
+        self.stopped = False
+        self.hits = 0
+        self.station_hits: Dict[int, int] = {}
+
+    def record(self, station: int, onset: float):
+        """Count a hit on ``station`` with its onset at monotonic time ``onset``."""
+        if not (self.start <= onset < self.end and (self.stations is None or station in self.stations)):
+            return
+        if self.refractory:
+            last = self.last_hit.get(station)
+            if last is not None and onset - last < self.refractory:
+                return
+            self.last_hit[station] = onset
+        self.hits += 1
+        self.station_hits[station] = self.station_hits.get(station, 0) + 1
+
+    def stop(self):
+        """Close the window now, if it is still open.
+
+        Stopped before it opened (during the countdown), the session counted
+        nothing and has nothing to wait for, so it settles at once.
+        """
+        now = time.monotonic()
+        if now < self.start:
+            self.start = self.end = now
+            self.settle = 0.0
+            self.stopped = True
+        elif now < self.end:
+            self.end = now
+            self.stopped = True
+
+    @property
+    def state(self) -> str:
+        now = time.monotonic()
+        if now < self.start:
+            return "scheduled"
+        if now < self.end:
+            return "running"
+        return "scoring" if now < self.end + self.settle else "finished"
+
+    def status(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "type": "session",
+            "session_id": self.id,
+            "state": self.state,
+            "duration": self.duration,
+            "starts_in": max(0.0, self.start - now),
+            "remaining": max(0.0, self.end - max(now, self.start)),
+            "hits": self.hits,
+            "stations": None if self.stations is None else sorted(self.stations)
+        }
+
+    def final_score(self) -> Dict[str, Any]:
+        return {
+            "type": "final_score",
+            "session_id": self.id,
+            "timestamp": time.time(),
+            "score": self.hits,
+            "station_hits": self.station_hits,
+            "duration": self.end - self.start,
+            "stopped": self.stopped
+        }
+
+class SessionRegistry:
+    """The sessions whose window is open or still settling, indexed by station.
+
+    A hit is only offered to the sessions scoring its station and to those
+    scoring every station, found with one dictionary lookup like
+    ``HitBroadcaster`` routes events, so dispatching a hit costs the same
+    however many games run on other stations.
+    """
+
+    def __init__(self):
+        self.sessions: Set[GameSession] = set()
+        self.shared: Set[GameSession] = set()  # Sessions scoring every station
+        self.by_station: Dict[int, Set[GameSession]] = {}
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def add(self, session: GameSession):
+        self.sessions.add(session)
+        if session.stations is None:
+            self.shared.add(session)
+        else:
+            for station in session.stations:
+                self.by_station.setdefault(station, set()).add(session)
+
+    def discard(self, session: GameSession):
+        self.sessions.discard(session)
+        self.shared.discard(session)
+        for station in session.stations or ():
+            sessions = self.by_station.get(station)
+            if sessions is not None:
+                sessions.discard(session)
+                if not sessions:
+                    del self.by_station[station]
+
+    def dispatch(self, station: int, onset: float):
+        """Offer a hit on ``station`` at monotonic time ``onset`` to the sessions scoring it."""
+        for session in self.shared:
+            session.record(station, onset)
+        for session in self.by_station.get(station, ()):
+            session.record(station, onset)
+
+game_sessions = SessionRegistry()
+session_controls: Dict[str, "SessionControl"] = {}  # Control running each session by id, oldest first
+
+def session_settle() -> float:
+    """How long after a session closes its last hits can still be reported."""
+    detection = max(((audio_input.blocksize + audio_input.detector.latency) / RATE
+                     for audio_input in audio_inputs), default=0.0)
+    return detection + SESSION_SETTLE
+
+class SessionControl:
+    """Answer one client's control messages and run its game session.
+
+    Clients send JSON text messages:
+
+    * ``{"type": "start", "duration": 30, "delay": 3, "stations": [0]}``
+      opens a session window ``delay`` seconds from now (e.g. after a
+      countdown) on ``stations``, or on every station of ``"device"``
+      (default: the client's stations); ``"refractory"`` optionally sets
+      the session's own minimum gap between counted hits;
+    * ``{"type": "stop"}`` closes it early;
+    * ``{"type": "reset"}`` drops it without a score;
+    * ``{"type": "status"}`` asks where it stands;
+    * ``{"type": "resume", "session_id": "..."}`` takes over the session
+      of a connection that was lost, which went on scoring meanwhile.
+
+    Each gets a ``session`` status reply (or an ``error``), and a
+    ``final_score`` message follows once a session has been settled; a
+    resumed session that was settled meanwhile is answered with it.
+
+    Sessions are registered by id in ``session_controls`` as they start, so
+    a client can resume its session before the server has noticed its old
+    connection is gone (which takes up to a ping interval and timeout):
+    the session is taken over from the old control, which keeps nothing.
+    """
+
+    def __init__(self, websocket, stations: Optional[Set[int]], outbox: ClientOutbox):
+        self.websocket = websocket
+        self.stations = stations
+        self.outbox = outbox
+        self.session: Optional[GameSession] = None
+        self._settling: Optional[asyncio.Task] = None
+
+    async def handle(self, message):
+        try:
+            if isinstance(message, bytes):
+                raise ValueError("Control messages are JSON text")
+            try:
+                request = json.loads(message)
+            except json.JSONDecodeError:
+                raise ValueError("Control messages are JSON objects") from None
+            reply = self._dispatch(request["type"], request)
+        except (ValueError, KeyError, TypeError) as e:
+            reply = {"type": "error", "message": str(e) if isinstance(e, ValueError) else f"Bad request: {e!r}"}
+        await self.websocket.send(json.dumps(reply))
+
+    def _dispatch(self, kind: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        if kind == "start":
+            if self.session is not None and self.session.state != "finished":
+                raise ValueError("A session is already running, stop or reset it first")
+            duration = float(request["duration"])
+            delay = float(request.get("delay", 0.0))
+            if not 0 < duration <= SESSION_MAX:
+                raise ValueError(f"Duration must be between 0 and {SESSION_MAX:g} seconds")
+            if not 0 <= delay <= SESSION_MAX:
+                raise ValueError(f"Delay must be between 0 and {SESSION_MAX:g} seconds")
+            refractory = float(request.get("refractory", 0.0))
+            if not (math.isfinite(refractory) and refractory >= 0):
+                raise ValueError("Refractory period must be a non-negative number of seconds")
+            session = GameSession(duration, self._session_stations(request), delay, session_settle(), refractory)
+            self.close()
+            game_sessions.add(session)
+            self._own(session)
+            self._settle()
+        elif kind == "stop":
+            if self.session is None or self.session.state not in ("scheduled", "running"):
+                raise ValueError("No session is running")
+            self.session.stop()
+            self._settle()
+        elif kind == "reset":
+            self.close()
+        elif kind == "resume":
+            if self.session is not None and self.session.state != "finished":
+                raise ValueError("A session is already running, stop or reset it first")
+            owner = session_controls.get(str(request["session_id"]))
+            if owner is None or owner.session is None:
+                raise ValueError(f"No session {request['session_id']!r} to resume")
+            session = owner.session
+            if owner is not self:
+                owner.release()
+                self.close()
+                self._own(session)
+            if session.state == "finished":
+                game_sessions.discard(session)
+                return session.final_score()
+            self._settle()
+        elif kind != "status":
+            raise ValueError(f"Unknown control message type {kind!r}")
+        if self.session is None:
+            return {"type": "session", "state": "idle", "client": self.outbox.stats()}
+        return {**self.session.status(), "client": self.outbox.stats()}
+
+    def _session_stations(self, request: Dict[str, Any]) -> Optional[Set[int]]:
+        """Stations a start request binds its session to."""
+        if "stations" in request and "device" in request:
+            raise ValueError("Bind a session to stations or to a device, not both")
+        if "device" in request:
+            for audio_input in audio_inputs:
+                if audio_input.device == request["device"]:
+                    return set(audio_input.stations)
+            raise ValueError(f"No capture device {request['device']!r}")
+        if request.get("stations") is None:
+            return self.stations
+        return {int(station) for station in request["stations"]}
+
+    def _settle(self):
+        """(Re)schedule the final score for when the session has settled."""
+        if self._settling is not None:
+            self._settling.cancel()
+        self._settling = asyncio.create_task(self._send_final_score(self.session))
+
+    async def _send_final_score(self, session: GameSession):
+        await asyncio.sleep(session.end + session.settle - time.monotonic())
+        game_sessions.discard(session)
+        print(f"🏁 Session {session.id} over: {session.hits} hits in {session.end - session.start:.2f} s")
+        try:
+            await self.websocket.send(json.dumps(session.final_score()))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def _own(self, session: GameSession):
+        """Run ``session`` from this control, and let it be resumed by id."""
+        self.session = session
+        session_controls.pop(session.id, None)
+        session_controls[session.id] = self
+        # Only sessions nobody is waiting on count against the limit, oldest first
+        idle = [control for control in session_controls.values()
+                if control.websocket is None or control.session.state == "finished"]
+        for control in idle[:max(0, len(idle) - RESUMABLE_SESSIONS)]:
+            game_sessions.discard(control.session)
+            del session_controls[control.session.id]
+            control.session = None
+
+    def release(self):
+        """Give the session up to a control resuming it; nothing is scored or sent here any more."""
+        if self._settling is not None:
+            self._settling.cancel()
+            self._settling = None
+        self.session = None
+
+    def detach(self):
+        """The connection is gone: keep scoring the session for the client to resume.
+
+        The session stays on ``game_sessions`` until it is resumed, or until
+        ``RESUMABLE_SESSIONS`` newer idle ones push it out.
+        """
+        self.websocket = None
+        if self._settling is not None:
+            self._settling.cancel()
+            self._settling = None
+
+    def close(self):
+        """Drop the session, if any, without scoring it."""
+        if self._settling is not None:
+            self._settling.cancel()
+            self._settling = None
+        if self.session is not None:
+            game_sessions.discard(self.session)
+            if session_controls.get(self.session.id) is self:
+                del session_controls[self.session.id]
+            self.session = None
+
+def requested_stations(path: str) -> Optional[Set[int]]:
+    """Parse the stations a client asked for, e.g. ``/?station=0,2``; None means all."""
+    values = parse_qs(urlparse(path).query).get("station")
+    if not values:
+        return None
+    return {int(station) for value in values for station in value.split(",") if station.strip()}
+
+def requested_replay(path: str):
+    """Parse where a reconnecting client left off, e.g. ``/?last_seq=41&epoch=9f86d081``.
+
+    Returns (last_seq, epoch), (None, None) for a new client.
+    """
+    query = parse_qs(urlparse(path).query)
+    if "last_seq" not in query:
+        return None, None
+    last_seq = int(query["last_seq"][0])
+    if last_seq < 0:
+        raise ValueError(last_seq)
+    return last_seq, query.get("epoch", [None])[0]
 
 async def handle_client(websocket):
     """Handle a WebSocket client connection."""
-    global connected_clients, websocket_running, hit_count, hit_queue
+    global connected_clients
+    
+    try:
+        stations = requested_stations(websocket.request.path)
+    except ValueError:
+        await websocket.close(1008, "station must be a list of integers")
+        return
+    try:
+        last_seq, epoch = requested_replay(websocket.request.path)
+    except ValueError:
+        await websocket.close(1008, "last_seq must be a non-negative integer")
+        return
     
     connected_clients.add(websocket)
     client_addr = websocket.remote_address
-    print(f"🔗 Client connected from {client_addr}")
+    print(f"🔗 Client connected from {client_addr}" + (" (binary)" if websocket.subprotocol else ""))
     
-    # Drain the queue first to clear any old messages
-    while not hit_queue.empty():
-        try:
-            hit_queue.get_nowait()
-        except asyncio.QueueEmpty:
-            break
+    def disconnect_slow_client():
+        print(f"🐢 Client {client_addr} fell behind ({inbox.lag * 1000:.0f} ms, "
+              f"{len(inbox.items)} queued), disconnecting")
+        asyncio.create_task(websocket.close(1013, "client too slow"))
     
-    await websocket.send(json.dumps({
+    # Subscribe and replay what a reconnecting client missed before anything else is published
+    binary = websocket.subprotocol == BINARY_SUBPROTOCOL
+    inbox = broadcaster.subscribe(stations, on_close=disconnect_slow_client, binary=binary)
+    control = SessionControl(websocket, stations, inbox)
+    connected = {
         "type": "connected",
         "timestamp": time.time(),
-        "message": "Connected to snare drum detector"
-    }))
+        "message": "Connected to snare drum detector",
+        "stations": [station for audio_input in audio_inputs for station in audio_input.stations],
+        "seq": broadcaster.seq,      # Events up to this one were published before the client subscribed
+        "epoch": broadcaster.epoch
+    }
+    if last_seq is not None:
+        if epoch == broadcaster.epoch and last_seq <= broadcaster.seq:
+            connected["missed"] = broadcaster.replay(inbox, stations, last_seq)
+            connected["resync"] = connected["missed"] > 0
+            print(f"🔁 Client {client_addr} resumed after event #{last_seq}: "
+                  f"{len(inbox.items)} messages replayed, {connected['missed']} events too old")
+        else:
+            connected["resync"] = True  # The server restarted since, its numbers start over
+    if binary:
+        connected["hit_record"] = HIT_RECORD.format  # Binary frames are runs of these records
+    await websocket.send(json.dumps(connected))
     
-    # Create a task to monitor the connection
+    # Create a task to answer control messages until the connection closes
     async def monitor_connection():
         try:
-            async for _ in websocket:
-                pass  # Just monitor for disconnection
+            async for message in websocket:
+                await control.handle(message)
         except websockets.exceptions.ConnectionClosed:
             pass
     
@@ -181,15 +2046,16 @@ async def handle_client(websocket):
     queue_task = None
     
     try:
-        if len(connected_clients) == 1 and not websocket_running:
-            websocket_running = True
-            hit_count = 0
-            print("🎤 Starting audio capture...")
+        if len(connected_clients) == 1 and (audio_capture is None or audio_capture.acquire()):
+            # Capture starts afresh (a client reconnecting within the grace period finds it running)
+            latency_meter.reset()
+            for audio_input in audio_inputs:
+                audio_input.reset()
         
-        # Process messages from the queue
+        # Forward broadcast events to this client
         while True:
             # Create task for getting from queue
-            queue_task = asyncio.create_task(hit_queue.get())
+            queue_task = asyncio.create_task(inbox.get())
             
             # Wait for either queue data or connection close
             done, pending = await asyncio.wait(
@@ -209,13 +2075,17 @@ async def handle_client(websocket):
             
             if queue_task in done:
                 # Got data from queue
+                item = queue_task.result()
+                if item is None:
+                    break  # The outbox gave up on this client and is disconnecting it
+                message, onset = item
                 try:
-                    hit_data = await queue_task
-                    await websocket.send(json.dumps(hit_data))
+                    await websocket.send(message)
                 except websockets.exceptions.ConnectionClosed:
-                    # Connection closed while sending, put message back
-                    await hit_queue.put(hit_data)
                     break
+                inbox.delivered()
+                if onset is not None:
+                    latency_meter.record(onset)
                     
     except Exception as e:
         print(f"Error in client handler: {e}")
@@ -235,49 +2105,87 @@ async def handle_client(websocket):
             except asyncio.CancelledError:
                 pass
         
+        control.detach()
+        broadcaster.unsubscribe(inbox)
         connected_clients.remove(websocket)
-        print(f"👋 Client disconnected from {client_addr}")
+        stats = inbox.stats()
+        print(f"👋 Client disconnected from {client_addr} (sent {stats['sent']}, dropped {stats['dropped']}, "
+              f"coalesced {stats['coalesced']}, max lag {stats['max_lag_ms']:.0f} ms)")
         
         if len(connected_clients) == 0:
-            websocket_running = False
-            print("🛑 No clients connected, audio capture paused")
+            if audio_capture is not None:
+                audio_capture.release()
+            print("🛑 No clients connected, detection paused")
+            latency_meter.report()
 
 
-async def websocket_audio_processor(device_index: Optional[int], threshold: float, verbose: bool):
-    """Process audio in WebSocket mode."""
-    global websocket_running, hit_count, hit_queue
+async def websocket_audio_processor(devices: List[Optional[int]], threshold: float, verbose: bool,
+                                    refractory: float = REFRACTORY, idle_grace: float = IDLE_GRACE,
+                                    detector_options: Optional[Dict[str, Any]] = None,
+                                    blocksize: Optional[int] = None):
+    """Process audio from every device in WebSocket mode."""
+    global audio_capture, audio_inputs
     
-    print(f"\n🎧 Audio device: {device_index if device_index is not None else 'default'}")
+    audio_inputs = open_inputs(devices, threshold, refractory, detector_options, blocksize)
+    latency_meter.onset_delay = max(onset_delay(audio_input.detector) for audio_input in audio_inputs)
+    for audio_input in audio_inputs:
+        device = audio_input.device if audio_input.device is not None else 'default'
+        first, last = audio_input.stations[0], audio_input.stations[-1]
+        stations = f"station {first}" if first == last else f"stations {first}-{last}"
+        print(f"\n🎧 Audio device: {device} ({stations})")
     if verbose:
         print(f"📊 Threshold: {threshold}")
+    if blocksize:
+        print_low_latency(audio_inputs[0])
     
-    with sd.InputStream(device=device_index,
-                        channels=CHANNELS,
-                        samplerate=RATE,
-                        callback=audio_callback,
-                        blocksize=int(RATE * BLOCK_DURATION)):
-        
+    loop = asyncio.get_running_loop()
+    # Opened now, but only started while clients are connected
+    streams = []
+    for audio_input in audio_inputs:
+        audio_input.ring.attach_loop(loop)
+        streams.append(audio_input.open_stream())
+    audio_capture = AudioCapture(streams, grace=idle_grace)
+    if connected_clients:
+        audio_capture.acquire()
+    
+    async def process(audio_input: AudioInput):
+        indata = np.empty_like(audio_input.ring.blocks[0])
         while True:
-            try:
-                indata = q.get_nowait()
-                if websocket_running:
-                    hit_data = detect_hits_detailed(indata, threshold=threshold)
-                    if hit_data:
-                        print(f"🥁 Hit #{hit_data['hit_number']} detected (RMS: {hit_data['rms_value']:.3f})")
-                        await hit_queue.put(hit_data)
-            except queue.Empty:
-                pass
-            await asyncio.sleep(0.001)
+            adc_time = await audio_input.ring.get_async(indata)
+            audio_input.report_overruns()
+            # Also during the grace period, so a reconnecting client gets replayed what it missed
+            for hit_data in audio_input.detect(indata, threshold, adc_time):
+                print(f"🥁 Hit #{hit_data['hit_number']} detected on station {hit_data['station']} "
+                      f"(RMS: {hit_data['rms_value']:.3f})")
+                onset = audio_input.clock.to_monotonic(hit_data["stream_time"])
+                game_sessions.dispatch(hit_data["station"], onset)
+                broadcaster.publish(hit_data)
+    
+    try:
+        await asyncio.gather(*(process(audio_input) for audio_input in audio_inputs))
+    finally:
+        audio_capture = None
+        for stream in streams:
+            stream.close()
 
-async def run_websocket_server(host: str, port: int, device_index: Optional[int], threshold: float, verbose: bool):
+async def run_websocket_server(host: str, port: int, devices: List[Optional[int]], threshold: float, verbose: bool,
+                               refractory: float = REFRACTORY, idle_grace: float = IDLE_GRACE,
+                               detector_options: Optional[Dict[str, Any]] = None, blocksize: Optional[int] = None,
+                               outbox_options: Optional[Dict[str, Any]] = None):
     """Run the WebSocket server."""
+    global broadcaster
+    broadcaster = HitBroadcaster(**(outbox_options or {}))
     print(f"\n🌐 Starting WebSocket server on {host}:{port}")
-    print(f"📡 Clients can connect to ws://{host}:{port}")
+    print(f"📡 Clients can connect to ws://{host}:{port} (JSON, or binary hits with subprotocol {BINARY_SUBPROTOCOL})")
+    print(f"🐢 Slow clients: {broadcaster.policy}, up to {broadcaster.capacity} queued messages"
+          + (f", {broadcaster.max_lag * 1000:.0f} ms of lag" if broadcaster.policy == "disconnect" else ""))
     print("Press Ctrl+C to stop the server\n")
     
-    audio_task = asyncio.create_task(websocket_audio_processor(device_index, threshold, verbose))
+    audio_task = asyncio.create_task(websocket_audio_processor(
+        devices, threshold, verbose, refractory, idle_grace, detector_options, blocksize))
     
-    async with websockets.serve(handle_client, host, port):
+    async with websockets.serve(handle_client, host, port, subprotocols=[BINARY_SUBPROTOCOL],
+                                select_subprotocol=select_subprotocol):
         try:
             await asyncio.Future()
         except KeyboardInterrupt:
@@ -285,6 +2193,7 @@ async def run_websocket_server(host: str, port: int, device_index: Optional[int]
         finally:
             audio_task.cancel()
             print("\n\n⚠️  WebSocket server stopped")
+            latency_meter.report()
 
 # =========================
 # Main Entrypoint
@@ -298,19 +2207,49 @@ def main():
   %(prog)s                              # Count hits for 30 seconds using default device
   %(prog)s -d 2 -t 60                   # Use device 2 for 60 seconds
   %(prog)s -t 45 --threshold 0.3       # Custom threshold for detection
+  %(prog)s -w --adaptive                # Follow the crowd noise instead of a fixed threshold
+  %(prog)s -w --reject-bleed            # Ignore bleed from neighbouring kits and the PA
+  %(prog)s -w --detector flux           # Spectral-flux onsets, sharper timing on transients
+  %(prog)s -w --low-latency             # 128-frame blocks, reports attack-to-send latency
+  %(prog)s -d 2 --channels 4 -w         # Four snare stations on one 4-input interface
+  %(prog)s -d 2 3 4 -w                  # One station per device, served by one process
+  %(prog)s -i session.wav              # Re-score a recorded session
+  %(prog)s -i venue.flac --shards 8     # Split one long recording over 8 processes
+  %(prog)s --batch recordings/ -j 4    # Re-score a folder of sessions on 4 cores
   %(prog)s --websocket                 # Start WebSocket server on default port
   %(prog)s -w -p 9000                   # WebSocket server on port 9000
-  %(prog)s -w --host 0.0.0.0           # Listen on all interfaces"""
+  %(prog)s -w --host 0.0.0.0           # Listen on all interfaces
+  %(prog)s -w --slow-client disconnect --max-lag 250  # Drop clients 250 ms behind"""
     )
     
     parser.add_argument('-l', '--list-devices', action='store_true', help='List all available audio input devices and exit')
-    parser.add_argument('-d', '--device', type=int, default=None, help='Audio input device index (default: system default)')
+    parser.add_argument('-d', '--device', type=int, nargs='+', default=None, help='Audio input device index; several devices are captured together in WebSocket mode (default: system default)')
+    parser.add_argument('-i', '--input-file', type=str, default=None, help='Analyze a recorded audio file (WAV/FLAC) instead of a live device')
+    parser.add_argument('--shards', type=int, default=1, help='Split --input-file into this many time shards analyzed in parallel (default: 1)')
+    parser.add_argument('--batch', type=str, default=None, help='Analyze every recording in a directory or matching a glob')
+    parser.add_argument('-o', '--output', type=str, default='results.jsonl', help='Batch results file, appended to and resumed from (default: results.jsonl)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Batch worker processes (default: one per CPU core)')
+    parser.add_argument('--channels', type=int, default=CHANNELS, help=f'Input channels to capture, each an independent station (default: {CHANNELS})')
     parser.add_argument('-t', '--duration', type=int, default=30, help='Sampling duration in seconds (default: 30)')
     parser.add_argument('--threshold', type=float, default=THRESHOLD, help=f'Detection threshold (default: {THRESHOLD})')
+    parser.add_argument('--refractory', type=float, default=REFRACTORY, help=f'Minimum time between two hits in seconds (default: {REFRACTORY})')
+    parser.add_argument('--decimate', type=int, default=DECIMATION, help=f'Downsample by this factor before the band filter to save CPU, e.g. 12 (default: {DECIMATION}, off)')
+    parser.add_argument('--adaptive', action='store_true', help='Raise the threshold above each channel\'s running noise floor; --threshold becomes the minimum')
+    parser.add_argument('--noise-margin', type=float, default=NOISE_MARGIN, help=f'Adaptive threshold as a multiple of the noise floor RMS (default: {NOISE_MARGIN})')
+    parser.add_argument('--reject-bleed', action='store_true', help=f'Drop hits whose first {BLEED_WINDOW * 1000:.0f} ms are too weak or too flat to be the snare in front of the mic (adds up to {BLEED_WINDOW * 1000:.0f} ms of latency)')
+    parser.add_argument('--peak-threshold', type=float, default=PEAK_THRESHOLD, help=f'Peak level a hit must reach with --reject-bleed (default: {PEAK_THRESHOLD})')
+    parser.add_argument('--wire-band', action='store_true', help=f'Also require snare-wire energy ({WIRE_LOWCUT}-{WIRE_HIGHCUT} Hz) to reject toms and kick; limits --decimate to 3 at {RATE} Hz')
+    parser.add_argument('--detector', choices=['rms', 'flux'], default='rms', help='Onset detector: band RMS envelopes (rms) or spectral flux over short overlapping frames (flux) (default: rms)')
+    parser.add_argument('--low-latency', type=int, nargs='?', const=LOW_LATENCY_BLOCK, default=None, metavar='FRAMES', help=f'Capture in small blocks (64-256 frames, default {LOW_LATENCY_BLOCK}) with low device latency instead of {BLOCK_DURATION * 1000:.0f} ms blocks, and report the attack-to-send latency (target {LATENCY_TARGET * 1000:.0f} ms)')
+    parser.add_argument('--no-numba', action='store_true', help='Use the NumPy detection path even when numba is installed')
     parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose output')
     parser.add_argument('-w', '--websocket', action='store_true', help='Enable WebSocket server mode')
     parser.add_argument('-p', '--port', type=int, default=8765, help='WebSocket server port (default: 8765)')
+    parser.add_argument('--idle-grace', type=float, default=IDLE_GRACE, help=f'Seconds to keep the audio stream running after the last client disconnects (default: {IDLE_GRACE})')
     parser.add_argument('--host', type=str, default='localhost', help='WebSocket server host (default: localhost)')
+    parser.add_argument('--slow-client', choices=SLOW_CLIENT_POLICIES, default='drop-oldest', help='What a client that cannot keep up gets: its oldest queued messages dropped, its backlog sent as one batch message (coalesce), or disconnected (default: drop-oldest)')
+    parser.add_argument('--outbox', type=int, default=OUTBOX_CAPACITY, help=f'Messages queued per client before --slow-client applies (default: {OUTBOX_CAPACITY})')
+    parser.add_argument('--max-lag', type=float, default=MAX_LAG * 1000, help=f'With --slow-client disconnect, milliseconds a client may fall behind (default: {MAX_LAG * 1000:.0f})')
     
     args = parser.parse_args()
     
@@ -318,26 +2257,114 @@ def main():
         list_devices()
         sys.exit(0)
     
+    if args.decimate < 1:
+        parser.error("Decimation factor must be a positive integer")
+    if args.wire_band and args.decimate > 1 and WIRE_HIGHCUT >= 0.4 * RATE / args.decimate:
+        parser.error(f"--wire-band needs the {WIRE_HIGHCUT} Hz band edge, "
+                     f"use --decimate {math.ceil(0.4 * RATE / WIRE_HIGHCUT) - 1} or less")
+    if args.channels < 1:
+        parser.error("Channels must be a positive integer")
+    if args.noise_margin <= 1:
+        parser.error("Noise margin must be greater than 1")
+    if args.low_latency is not None and not 1 <= args.low_latency <= int(RATE * BLOCK_DURATION):
+        parser.error(f"Low-latency blocks must be 1 to {int(RATE * BLOCK_DURATION)} frames")
+    if args.detector == 'flux' and (args.decimate > 1 or args.adaptive or args.reject_bleed or args.wire_band):
+        parser.error("--decimate, --adaptive, --reject-bleed and --wire-band only apply to the rms detector")
+    detector_options = {"decimation": args.decimate, "use_numba": USE_NUMBA and not args.no_numba,
+                        "channels": args.channels, "adaptive": args.adaptive, "noise_margin": args.noise_margin,
+                        "reject_bleed": args.reject_bleed, "peak_threshold": args.peak_threshold,
+                        "wire_band": args.wire_band, "method": args.detector}
+    
     if args.device is not None:
         devices = sd.query_devices()
-        if args.device < 0 or args.device >= len(devices):
-            print(f"Error: Device index {args.device} is out of range.")
+        for device in args.device:
+            if device < 0 or device >= len(devices):
+                print(f"Error: Device index {device} is out of range.")
+                sys.exit(1)
+            if devices[device]['max_input_channels'] == 0:
+                print(f"Error: Device {device} has no input channels.")
+                sys.exit(1)
+            if devices[device]['max_input_channels'] < args.channels:
+                print(f"Error: Device {device} has only {devices[device]['max_input_channels']} input channels.")
+                sys.exit(1)
+        if len(set(args.device)) != len(args.device):
+            parser.error("Each device can only be given once")
+        if len(args.device) > 1 and not args.websocket:
+            parser.error("Several devices are only supported in WebSocket mode (-w)")
+    
+    if args.batch:
+        if args.jobs is not None and args.jobs < 1:
+            parser.error("Jobs must be a positive integer")
+        
+        try:
+            run_batch(
+                args.batch,
+                args.output,
+                jobs=args.jobs,
+                threshold=args.threshold,
+                refractory=args.refractory,
+                detector_options=detector_options
+            )
+        except KeyboardInterrupt:
+            print("\n\n⚠️  Batch interrupted by user, run again to resume")
+            sys.exit(0)
+        except Exception as e:
+            print(f"\n❌ Error: {e}")
             sys.exit(1)
-        if devices[args.device]['max_input_channels'] == 0:
-            print(f"Error: Device {args.device} has no input channels.")
+    elif args.input_file:
+        if args.shards < 1:
+            parser.error("Shards must be a positive integer")
+        if args.jobs is not None and args.jobs < 1:
+            parser.error("Jobs must be a positive integer")
+        
+        try:
+            if args.shards > 1:
+                analyze_file_sharded(
+                    args.input_file,
+                    args.shards,
+                    jobs=args.jobs,
+                    threshold=args.threshold,
+                    refractory=args.refractory,
+                    detector_options=detector_options,
+                    verbose=args.verbose
+                )
+            else:
+                analyze_file(
+                    args.input_file,
+                    threshold=args.threshold,
+                    refractory=args.refractory,
+                    detector_options=detector_options,
+                    verbose=args.verbose
+                )
+        except KeyboardInterrupt:
+            print("\n\n⚠️  Analysis interrupted by user")
+            sys.exit(0)
+        except Exception as e:
+            print(f"\n❌ Error: {e}")
             sys.exit(1)
-    
-    if args.websocket:
+    elif args.websocket:
         if args.port < 1 or args.port > 65535:
             parser.error("Port must be between 1 and 65535")
+        if args.idle_grace < 0:
+            parser.error("Idle grace period cannot be negative")
+        if args.outbox < 1:
+            parser.error("Outbox must hold at least one message")
+        if args.max_lag <= 0:
+            parser.error("Maximum lag must be positive")
         
         try:
             asyncio.run(run_websocket_server(
                 host=args.host,
                 port=args.port,
-                device_index=args.device,
+                devices=args.device or [None],
                 threshold=args.threshold,
-                verbose=args.verbose
+                verbose=args.verbose,
+                refractory=args.refractory,
+                detector_options=detector_options,
+                idle_grace=args.idle_grace,
+                blocksize=args.low_latency,
+                outbox_options={"capacity": args.outbox, "policy": args.slow_client,
+                                "max_lag": args.max_lag / 1000}
             ))
         except KeyboardInterrupt:
             print("\n⚠️  WebSocket server stopped by user")
@@ -352,9 +2379,12 @@ def main():
         try:
             run_snare_counter(
                 duration=args.duration,
-                device_index=args.device,
+                device_index=args.device[0] if args.device else None,
                 threshold=args.threshold,
-                verbose=args.verbose
+                verbose=args.verbose,
+                refractory=args.refractory,
+                detector_options=detector_options,
+                blocksize=args.low_latency
             )
         except KeyboardInterrupt:
             print("\n\n⚠️  Detection interrupted by user")
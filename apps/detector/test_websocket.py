@@ -4,14 +4,23 @@
 import asyncio
 import websockets
 import json
+import struct
 import sys
 
+# Pass --binary to receive hits as fixed-layout records (main.HIT_RECORD) instead of JSON
+BINARY = "--binary" in sys.argv
+# Copies of main.BINARY_SUBPROTOCOL and main.HIT_RECORD, so this client runs without the
+# detector's dependencies; main.py is the source of truth and these must follow it
+BINARY_SUBPROTOCOL = "snare.hits.v2"
+HIT_RECORD = struct.Struct("<BxHHhIIddff")
+
 async def test_client():
     uri = "ws://localhost:8765"
     print(f"Connecting to {uri}...")
     
     try:
-        async with websockets.connect(uri) as websocket:
+        subprotocols = [BINARY_SUBPROTOCOL] if BINARY else None
+        async with websockets.connect(uri, subprotocols=subprotocols) as websocket:
             print("Connected! Waiting for messages...")
             
             # Listen for messages
@@ -19,13 +28,22 @@ async def test_client():
             while message_count < 10:  # Listen for up to 10 messages
                 try:
                     message = await asyncio.wait_for(websocket.recv(), timeout=30.0)
+                    if isinstance(message, bytes):
+                        for _, station, channel, device, hit_number, seq, timestamp, _, rms, _ in HIT_RECORD.iter_unpack(message):
+                            message_count += 1
+                            print(f"🥁 Hit #{hit_number} (event {seq}) on station {station}: RMS={rms:.3f}, Time={timestamp:.2f} (binary)")
+                        continue
                     data = json.loads(message)
                     
                     if data["type"] == "connected":
-                        print(f"✅ Connection confirmed: {data['message']}")
+                        print(f"✅ Connection confirmed: {data['message']} (events so far: {data.get('seq', 0)})")
                     elif data["type"] == "hit":
                         message_count += 1
-                        print(f"🥁 Hit #{data['hit_number']}: RMS={data['rms_value']:.3f}, Time={data['timestamp']:.2f}")
+                        print(f"🥁 Hit #{data['hit_number']} on channel {data.get('channel', 0)}: RMS={data['rms_value']:.3f}, Time={data['timestamp']:.2f}")
+                    elif data["type"] == "batch":
+                        # Sent when this client fell behind and the server coalesced its backlog
+                        message_count += len(data["events"])
+                        print(f"📦 Batch of {len(data['events'])} hits, up to #{data['events'][-1]['hit_number']}")
                     else:
                         print(f"📨 Received: {data}")
                         
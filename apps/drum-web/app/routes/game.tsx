@@ -87,6 +87,7 @@ type GameStatus = "ready" | "countdown" | "playing" | "ended";
 
 interface HitMessage {
 	type: "hit";
+	seq: number; // Increases by one per event the detector publishes
 	timestamp: number;
 	hit_number: number;
 	rms_value: number;
@@ -97,10 +98,38 @@ interface ConnectedMessage {
 	type: "connected";
 	timestamp: number;
 	message: string;
+	seq: number; // Last event published before this connection
+	epoch: string; // Changes when the detector restarts, and with it the seq numbers
+	resync?: boolean; // Events we missed while disconnected could not all be replayed
+	missed?: number;
+}
+
+// Events the detector coalesced because this client fell behind
+interface BatchMessage {
+	type: "batch";
+	events: HitMessage[];
+}
+
+// Score of the session the detector timed (see the "start" message below)
+interface FinalScoreMessage {
+	type: "final_score";
+	session_id: string;
+	score: number;
+	duration: number;
+	stopped: boolean;
+}
+
+interface ControlReplyMessage {
+	type: "session" | "error";
+	session_id?: string;
+	state?: string;
+	message?: string;
 }
 
 const COUNTDOWN_DURATION = 3; // seconds
 const WEBSOCKET_URL = import.meta.env.VITE_WS_URL || "ws://localhost:8765";
+const RECONNECT_DELAY = 1000; // ms
+const FINAL_SCORE_WAIT = 5000; // ms to wait for the detector's final score (and a reconnect) before using our own count
 
 export default function Game() {
 	const { gameDuration } = useLoaderData<typeof loader>();
@@ -116,6 +145,10 @@ export default function Game() {
 	const [connectionError, setConnectionError] = useState<string | null>(null);
 	const [drumAnimation, setDrumAnimation] = useState(false);
 	const [scoreSubmitted, setScoreSubmitted] = useState(false);
+	const [finalScore, setFinalScore] = useState<number | null>(null);
+	// The detector was asked to time this game and has not turned it down
+	const [sessionStarted, setSessionStarted] = useState(false);
+	const [finalScoreOverdue, setFinalScoreOverdue] = useState(false);
 
 	const fetcher = useFetcher();
 	const wsRef = useRef<WebSocket | null>(null);
@@ -125,6 +158,12 @@ export default function Game() {
 	const hitTimestampsRef = useRef<number[]>([]);
 	const gameStatusRef = useRef<GameStatus>("ready");
 	const gameStartTimeRef = useRef<number>(0);
+	const sessionDurationRef = useRef<number | null>(null);
+	// Where we left off, so a reconnect gets replayed the hits we missed
+	const lastSeqRef = useRef<number | null>(null);
+	const epochRef = useRef<string | null>(null);
+	const sessionIdRef = useRef<string | null>(null);
+	const resumingRef = useRef(false);
 
 	// Calculate hit rate based on recent hits
 	const calculateHitRate = useCallback(() => {
@@ -136,82 +175,159 @@ export default function Game() {
 		setHitRate(Math.round(rate * 10) / 10);
 	}, []);
 
-	// Handle WebSocket connection - connect once when component mounts
+	// Handle WebSocket connection - connect when component mounts, reconnect when dropped
 	useEffect(() => {
-		// Connect to WebSocket
-		try {
-			const ws = new WebSocket(WEBSOCKET_URL);
-			wsRef.current = ws;
-
-			ws.onopen = () => {
-				setIsConnected(true);
-				setConnectionError(null);
-				console.log("Connected to detector");
-			};
-
-			ws.onmessage = (event) => {
-				try {
-					const data = JSON.parse(event.data) as HitMessage | ConnectedMessage;
-
-					if (data.type === "connected") {
-						console.log("Detector ready:", data.message);
-					} else if (
-						data.type === "hit" &&
-						gameStatusRef.current === "playing"
-					) {
-						// Handle hit
-						setScore((prev) => prev + 1);
-
-						// Update combo
-						const now = Date.now();
-						if (now - lastHitTimeRef.current < 2000) {
-							// Within 2 seconds
-							setCurrentCombo((prev) => {
-								const newCombo = prev + 1;
-								setBestCombo((current) => Math.max(current, newCombo));
-								return newCombo;
-							});
-						} else {
-							setCurrentCombo(1);
+		let closing = false;
+		let reconnectTimer: number | null = null;
+
+		const connect = () => {
+			try {
+				// After a drop, ask the detector for what we missed and to resume our session
+				const url = new URL(WEBSOCKET_URL);
+				if (lastSeqRef.current !== null && epochRef.current !== null) {
+					url.searchParams.set("last_seq", lastSeqRef.current.toString());
+					url.searchParams.set("epoch", epochRef.current);
+				}
+				const ws = new WebSocket(url);
+				wsRef.current = ws;
+
+				ws.onopen = () => {
+					setIsConnected(true);
+					setConnectionError(null);
+					console.log("Connected to detector");
+					if (sessionIdRef.current !== null) {
+						resumingRef.current = true;
+						ws.send(
+							JSON.stringify({ type: "resume", session_id: sessionIdRef.current }),
+						);
+					} else {
+						// A start whose reply never came went down with the old connection
+						setSessionStarted(false);
+					}
+				};
+
+				ws.onmessage = (event) => {
+					try {
+						const data = JSON.parse(event.data) as
+							| HitMessage
+							| ConnectedMessage
+							| BatchMessage
+							| FinalScoreMessage
+							| ControlReplyMessage;
+
+						if (data.type === "connected") {
+							console.log("Detector ready:", data.message);
+							if (data.resync) {
+								console.warn("Hits missed while disconnected are lost:", data.missed);
+							}
+							if (data.epoch !== epochRef.current) {
+								// New detector run, its events are numbered from scratch
+								epochRef.current = data.epoch;
+								lastSeqRef.current = data.seq;
+							}
+							return;
 						}
-						lastHitTimeRef.current = now;
-
-						// Track hit for rate calculation
-						hitTimestampsRef.current.push(now);
-						calculateHitRate();
-
-						// Trigger drum animation
-						setDrumAnimation(true);
-						setTimeout(() => setDrumAnimation(false), 200);
+						if (data.type === "final_score") {
+							sessionIdRef.current = null;
+							resumingRef.current = false;
+							// The detector's count over its own timed window is the score
+							setScore(data.score);
+							setFinalScore(data.score);
+							sessionDurationRef.current = data.duration;
+							setGameStatus("ended");
+							return;
+						}
+						if (data.type === "session" || data.type === "error") {
+							console.log("Detector session:", data);
+							if (data.type === "session" && data.session_id) {
+								sessionIdRef.current = data.session_id;
+							} else if (
+								data.type === "error" &&
+								(resumingRef.current || sessionIdRef.current === null)
+							) {
+								// The detector lost our session or never opened it, fall back to our own timing
+								sessionIdRef.current = null;
+								setSessionStarted(false);
+							}
+							resumingRef.current = false;
+							return;
+						}
+						const hits = data.type === "batch" ? data.events : [data];
+						for (const hit of hits) {
+							if (hit.type !== "hit") {
+								continue;
+							}
+							// Replayed hits we already had are skipped
+							if (lastSeqRef.current !== null && hit.seq <= lastSeqRef.current) {
+								continue;
+							}
+							lastSeqRef.current = hit.seq;
+							if (gameStatusRef.current !== "playing") {
+								continue;
+							}
+							// Handle hit
+							setScore((prev) => prev + 1);
+
+							// Update combo
+							const now = Date.now();
+							if (now - lastHitTimeRef.current < 2000) {
+								// Within 2 seconds
+								setCurrentCombo((prev) => {
+									const newCombo = prev + 1;
+									setBestCombo((current) => Math.max(current, newCombo));
+									return newCombo;
+								});
+							} else {
+								setCurrentCombo(1);
+							}
+							lastHitTimeRef.current = now;
+
+							// Track hit for rate calculation
+							hitTimestampsRef.current.push(now);
+							calculateHitRate();
+
+							// Trigger drum animation
+							setDrumAnimation(true);
+							setTimeout(() => setDrumAnimation(false), 200);
+						}
+					} catch (err) {
+						console.error("Failed to parse message:", err);
 					}
-				} catch (err) {
-					console.error("Failed to parse message:", err);
-				}
-			};
-
-			ws.onerror = (error) => {
-				console.error("WebSocket error:", error);
+				};
+
+				ws.onerror = (error) => {
+					console.error("WebSocket error:", error);
+					setConnectionError("Failed to connect to detector");
+					setIsConnected(false);
+				};
+
+				ws.onclose = () => {
+					setIsConnected(false);
+					console.log("Disconnected from detector");
+					if (!closing) {
+						reconnectTimer = window.setTimeout(connect, RECONNECT_DELAY);
+					}
+				};
+			} catch (err) {
 				setConnectionError("Failed to connect to detector");
-				setIsConnected(false);
-			};
+				console.error("WebSocket connection failed:", err);
+			}
+		};
 
-			ws.onclose = () => {
-				setIsConnected(false);
-				console.log("Disconnected from detector");
-			};
-		} catch (err) {
-			setConnectionError("Failed to connect to detector");
-			console.error("WebSocket connection failed:", err);
-		}
+		connect();
 
 		return () => {
 			// Cleanup WebSocket on unmount
+			closing = true;
+			if (reconnectTimer !== null) {
+				clearTimeout(reconnectTimer);
+			}
 			if (wsRef.current) {
 				wsRef.current.close();
 				wsRef.current = null;
 			}
 		};
-	}, []); // Empty dependency array - connect once on mount
+	}, []); // Empty dependency array - connect on mount
 
 	// Start countdown when game status changes to countdown
 	useEffect(() => {
@@ -220,6 +336,20 @@ export default function Game() {
 			setCountdown(COUNTDOWN_DURATION);
 			// Reset game timer to configured duration when starting countdown
 			setTimeRemaining(gameDuration);
+			// The detector times the game itself, starting when the countdown ends
+			const ws = wsRef.current;
+			if (ws && ws.readyState === WebSocket.OPEN) {
+				ws.send(
+					JSON.stringify({
+						type: "start",
+						duration: gameDuration,
+						delay: COUNTDOWN_DURATION,
+					}),
+				);
+				setSessionStarted(true);
+			} else {
+				setSessionStarted(false);
+			}
 
 			countdownTimerRef.current = window.setInterval(() => {
 				setCountdown((prev) => {
@@ -279,6 +409,19 @@ export default function Game() {
 		}
 	}, [gameStatus, calculateHitRate]);
 
+	// Give the detector's final score a bounded time to arrive, through a reconnect if need be
+	useEffect(() => {
+		if (gameStatus !== "ended") {
+			setFinalScoreOverdue(false);
+			return;
+		}
+		if (!sessionStarted || finalScore !== null) {
+			return;
+		}
+		const timer = window.setTimeout(() => setFinalScoreOverdue(true), FINAL_SCORE_WAIT);
+		return () => clearTimeout(timer);
+	}, [gameStatus, sessionStarted, finalScore]);
+
 	// Submit score when game ends
 	useEffect(() => {
 		console.log("Score submission check:", {
@@ -288,16 +431,21 @@ export default function Game() {
 			condition: gameStatus === "ended" && !scoreSubmitted
 		});
 		
-		if (gameStatus === "ended" && !scoreSubmitted) {
-			const gameDuration = (Date.now() - gameStartTimeRef.current) / 1000; // Convert to seconds
+		// Wait for the detector's final score, unless it is not timing this game or is overdue
+		const awaitingFinalScore =
+			sessionStarted && finalScore === null && !finalScoreOverdue;
+		if (gameStatus === "ended" && !scoreSubmitted && !awaitingFinalScore) {
+			const gameDuration =
+				sessionDurationRef.current ??
+				(Date.now() - gameStartTimeRef.current) / 1000; // Convert to seconds
 
 			const formData = new FormData();
-			formData.append("score", score.toString());
+			formData.append("score", (finalScore ?? score).toString());
 			formData.append("combo", bestCombo.toString());
 			formData.append("duration", gameDuration.toString());
 
 			console.log("Submitting score:", {
-				score,
+				score: finalScore ?? score,
 				combo: bestCombo,
 				duration: gameDuration
 			});
@@ -305,7 +453,7 @@ export default function Game() {
 			fetcher.submit(formData, { method: "post" });
 			setScoreSubmitted(true);
 		}
-	}, [gameStatus, score, bestCombo, scoreSubmitted, fetcher]);
+	}, [gameStatus, score, finalScore, sessionStarted, finalScoreOverdue, bestCombo, scoreSubmitted, fetcher]);
 
 	// Log fetcher state for debugging
 	useEffect(() => {